@@ -1,4 +1,19 @@
 import { app } from "../../scripts/app.js";
+import { api } from "../../scripts/api.js";
+
+const formatBytes = (b) => {
+    if (!b || b <= 0) return "0 B";
+    const units = ["B", "KB", "MB", "GB", "TB"];
+    const i = Math.min(units.length - 1, Math.floor(Math.log(b) / Math.log(1024)));
+    return `${(b / Math.pow(1024, i)).toFixed(i > 1 ? 1 : 0)} ${units[i]}`;
+};
+
+const formatEta = (s) => {
+    if (s === null || s === undefined) return "--";
+    if (s >= 3600) return `${Math.floor(s / 3600)}h ${Math.floor((s % 3600) / 60)}m`;
+    if (s >= 60) return `${Math.floor(s / 60)}m ${s % 60}s`;
+    return `${s}s`;
+};
 
 app.registerExtension({
     name: "AcademiaSD.Downloader",
@@ -43,9 +58,7 @@ app.registerExtension({
                     if (this.folders_loaded && this.rowsContainer && this.rowsContainer.children.length === 0) {
                         this.rowsContainer.innerHTML = "";
                         this.restored_models.forEach(m => this.addRow(m, true));
-                        setTimeout(() => { 
-                            Array.from(this.rowsContainer.children).forEach((r, idx) => setTimeout(() => this.checkRowStatus(r), idx * 200)); 
-                        }, 500);
+                        setTimeout(() => this.checkAllRows(), 500);
                     }
                 }
             };
@@ -115,7 +128,10 @@ app.registerExtension({
                         <button id="asd-btn-export" class="asd-btn">📤 Export</button>
                     </div>
                     <div id="asd-rows-container" style="display: flex; flex-direction: column; gap: 4px;"></div>
-                    <button id="asd-btn-dl-all" class="asd-btn" style="margin-top: auto; background: #1a5c2b; border-color: #2d9444; padding: 8px;">⬇️ Download All Enabled</button>
+                    <div style="display: flex; gap: 8px; margin-top: auto;">
+                        <button id="asd-btn-dl-all" class="asd-btn" style="flex: 3; background: #1a5c2b; border-color: #2d9444; padding: 8px;">⬇️ Download All Enabled</button>
+                        <button id="asd-btn-prefetch" class="asd-btn" style="flex: 1; padding: 8px;" title="Download every missing model referenced by the current workflow">🧩 Workflow Models</button>
+                    </div>
                 `;
 
                 this.rowsContainer = container.querySelector("#asd-rows-container");
@@ -174,56 +190,85 @@ app.registerExtension({
                     };
                 };
 
-                const checkRowStatus = async (row) => {
-                    const payload = getRowPayload(row);
-                    if(!payload.url || payload.url === "none") return;
-                    
+                const applyRowStatus = (row, data) => {
                     const led = row.querySelector(".asd-led");
                     const btn = row.querySelector(".asd-dl-btn");
                     const sizeLabel = row.querySelector(".size-label");
                     const fileSelect = row.querySelector(".file-select");
                     const fnameInput = row.querySelector(".filename-input");
 
+                    if (data.filename && data.filename !== "Direct Link" && data.filename !== "Pending...") {
+                        if (fileSelect.style.display !== "block") {
+                            fnameInput.value = data.filename;
+                            fnameInput.style.color = "#ddd"; 
+                        }
+                    }
+                    
+                    let newSize = data.filesize || "Unknown";
+                    if ((newSize === "Unknown" || newSize === "Error" || newSize === "0 B") && fileSelect.style.display === "block") {
+                         const opt = fileSelect.options[fileSelect.selectedIndex];
+                         if (opt && opt.dataset.size) newSize = opt.dataset.size;
+                    }
+                    if (newSize !== "Unknown" && newSize !== "Error" && newSize !== "0 B") {
+                         sizeLabel.innerText = newSize;
+                    }
+
+                    if (data.exists) {
+                        led.style.backgroundColor = "#00ff00"; led.title = `Ready: ${data.filename}`;
+                        btn.innerText = "Completed"; btn.disabled = true; btn.style.background = "#008800";
+                    } else if (data.is_downloading) {
+                        led.style.backgroundColor = "yellow"; led.title = `Downloading...`;
+                        btn.innerText = data.queue_state === "queued" ? "🕒 Queued" : `⏳ ${data.progress >= 0 ? data.progress + "%" : "..."}`; 
+                        btn.disabled = true; btn.style.background = "#555";
+                    } else if (data.message === "auth_required") {
+                        led.style.backgroundColor = "#ff00ff"; led.title = "API Key Required";
+                        btn.innerText = "Need Token"; btn.disabled = false; btn.style.background = "#aa00aa";
+                    } else if (data.resumable) {
+                        led.style.backgroundColor = "red"; led.title = "Interrupted download (resumable)";
+                        btn.innerText = `⏯️ Resume ${data.progress}%`; btn.disabled = false; btn.style.background = "#225588";
+                    } else {
+                        led.style.backgroundColor = "red"; led.title = "Not downloaded";
+                        btn.innerText = "Download"; btn.disabled = false; btn.style.background = "#225588";
+                    }
+                    return data;
+                };
+
+                const checkRowStatus = async (row) => {
+                    const payload = getRowPayload(row);
+                    if(!payload.url || payload.url === "none") return;
+                    
+                    const led = row.querySelector(".asd-led");
                     led.style.backgroundColor = "orange";
                     
                     try {
                         const res = await fetch("/academia/check", { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify(payload) });
-                        const data = await res.json();
-                        
-                        if (data.filename && data.filename !== "Direct Link" && data.filename !== "Pending...") {
-                            if (fileSelect.style.display !== "block") {
-                                fnameInput.value = data.filename;
-                                fnameInput.style.color = "#ddd"; 
-                            }
-                        }
-                        
-                        let newSize = data.filesize || "Unknown";
-                        if ((newSize === "Unknown" || newSize === "Error" || newSize === "0 B") && fileSelect.style.display === "block") {
-                             const opt = fileSelect.options[fileSelect.selectedIndex];
-                             if (opt && opt.dataset.size) newSize = opt.dataset.size;
-                        }
-                        if (newSize !== "Unknown" && newSize !== "Error" && newSize !== "0 B") {
-                             sizeLabel.innerText = newSize;
-                        }
-
-                        if (data.exists) {
-                            led.style.backgroundColor = "#00ff00"; led.title = `Ready: ${data.filename}`;
-                            btn.innerText = "Completed"; btn.disabled = true; btn.style.background = "#008800";
-                        } else if (data.is_downloading) {
-                            led.style.backgroundColor = "yellow"; led.title = `Downloading...`;
-                            btn.innerText = `⏳ ${data.progress >= 0 ? data.progress + "%" : "..."}`; 
-                            btn.disabled = true; btn.style.background = "#555";
-                        } else if (data.message === "auth_required") {
-                            led.style.backgroundColor = "#ff00ff"; led.title = "API Key Required";
-                            btn.innerText = "Need Token"; btn.disabled = false; btn.style.background = "#aa00aa";
-                        } else {
-                            led.style.backgroundColor = "red"; led.title = "Not downloaded";
-                            btn.innerText = "Download"; btn.disabled = false; btn.style.background = "#225588";
-                        }
-                        return data;
+                        return applyRowStatus(row, await res.json());
                     } catch (e) { led.style.backgroundColor = "red"; }
                 };
 
+                // Una sola petición para toda la lista: el servidor resuelve las filas en paralelo
+                const checkAllRows = async () => {
+                    const rows = Array.from(_this.rowsContainer.children).filter(r => {
+                        const p = getRowPayload(r);
+                        return p.url && p.url !== "none";
+                    });
+                    if (rows.length === 0) return;
+                    rows.forEach(r => r.querySelector(".asd-led").style.backgroundColor = "orange");
+                    try {
+                        const payloads = rows.map(r => {
+                            const { civitai_token, hf_token, ...rest } = getRowPayload(r);
+                            return rest;
+                        });
+                        const res = await fetch("/academia/check_batch", { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify({
+                            rows: payloads,
+                            civitai_token: container.querySelector("#asd-civ-token").value,
+                            hf_token: container.querySelector("#asd-hf-token").value
+                        }) });
+                        const data = await res.json();
+                        rows.forEach((r, idx) => applyRowStatus(r, data.results[idx] || {}));
+                    } catch (e) { rows.forEach(r => r.querySelector(".asd-led").style.backgroundColor = "red"); }
+                };
+
                 const downloadRow = async (row) => {
                     const payload = getRowPayload(row);
                     if(!payload.url || payload.url === "none") return;
@@ -233,15 +278,60 @@ app.registerExtension({
                     btn.innerText = "⏳ Starting..."; btn.disabled = true; btn.style.background = "#555";
                     led.style.backgroundColor = "yellow";
                     
+                    // El progreso llega por websocket (academia.download.progress), sin sondeo
                     try {
-                        await fetch("/academia/download", { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify(payload) });
-                        const poll = setInterval(async () => {
-                            const data = await checkRowStatus(row);
-                            if(data && data.exists && !data.is_downloading) clearInterval(poll);
-                        }, 3000);
+                        const res = await fetch("/academia/download", { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify(payload) });
+                        const data = await res.json();
+                        if (data.message === "insufficient_space") {
+                            led.style.backgroundColor = "red"; led.title = data.detail;
+                            btn.innerText = "💾 No space"; btn.title = data.detail; btn.disabled = false; btn.style.background = "#883322";
+                        } else if (data.status !== "started") checkRowStatus(row);
                     } catch (e) {}
                 };
 
+                const onDownloadProgress = (event) => {
+                    const d = event.detail;
+                    if (!_this.rowsContainer) return;
+                    for (const row of _this.rowsContainer.children) {
+                        if (getRowPayload(row).url !== d.url) continue;
+                        const led = row.querySelector(".asd-led");
+                        const btn = row.querySelector(".asd-dl-btn");
+                        if (d.state === "queued") {
+                            led.style.backgroundColor = "yellow"; led.title = "Waiting in the download queue";
+                            btn.innerText = "🕒 Queued"; btn.disabled = true; btn.style.background = "#555";
+                        } else if (d.state === "downloading") {
+                            led.style.backgroundColor = "yellow";
+                            led.title = `${formatBytes(d.done_bytes)} / ${formatBytes(d.total_bytes)} · ${formatBytes(d.speed)}/s · ETA ${formatEta(d.eta)}`;
+                            btn.innerText = `⏳ ${d.progress >= 0 ? d.progress + "%" : "..."}`; btn.title = led.title;
+                            btn.disabled = true; btn.style.background = "#555";
+                        } else {
+                            btn.title = "";
+                            checkRowStatus(row);
+                        }
+                    }
+                };
+                api.addEventListener("academia.download.progress", onDownloadProgress);
+
+                let prefetchId = null;
+                const renderPrefetch = (d) => {
+                    const btn = container.querySelector("#asd-btn-prefetch");
+                    const c = d.counts || {};
+                    const active = (c.queued || 0) + (c.downloading || 0);
+                    btn.title = `${c.done || 0}/${d.files.length} ready · ${formatBytes(d.done_bytes)} / ${formatBytes(d.total_bytes)}` + (c.error ? ` · ${c.error} failed` : "");
+                    btn.innerText = active > 0 ? `🧩 ${d.progress}% (${active} left)` : (c.error ? `🧩 ${c.error} failed` : "🧩 All ready");
+                };
+                const onPrefetchProgress = (event) => {
+                    if (event.detail.id === prefetchId) renderPrefetch(event.detail);
+                };
+                api.addEventListener("academia.prefetch.progress", onPrefetchProgress);
+
+                const onRemoved = this.onRemoved;
+                this.onRemoved = function () {
+                    api.removeEventListener("academia.download.progress", onDownloadProgress);
+                    api.removeEventListener("academia.prefetch.progress", onPrefetchProgress);
+                    if (onRemoved) return onRemoved.apply(this, arguments);
+                };
+
                 let draggedRow = null;
 
                 const addRow = (data = {}, isRestoring = false) => {
@@ -419,12 +509,11 @@ app.registerExtension({
                 // Exponemos las funciones al nodo para resolver hilos de ejecución asíncronos en onConfigure
                 this.addRow = addRow;
                 this.checkRowStatus = checkRowStatus;
+                this.checkAllRows = checkAllRows;
 
                 container.querySelector("#asd-btn-add").addEventListener("click", () => addRow());
                 
-                container.querySelector("#asd-btn-check").addEventListener("click", async () => {
-                    Array.from(this.rowsContainer.children).forEach(r => checkRowStatus(r));
-                });
+                container.querySelector("#asd-btn-check").addEventListener("click", () => checkAllRows());
 
                 container.querySelector("#asd-btn-dl-all").addEventListener("click", async () => {
                     Array.from(this.rowsContainer.children).forEach(r => {
@@ -440,6 +529,24 @@ app.registerExtension({
                     });
                 });
 
+                container.querySelector("#asd-btn-prefetch").addEventListener("click", async (e) => {
+                    const btn = e.target;
+                    btn.innerText = "⌛ Scanning...";
+                    try {
+                        const res = await fetch("/academia/workflow_prefetch", { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify({
+                            workflow: app.graph.serialize(),
+                            civitai_token: container.querySelector("#asd-civ-token").value,
+                            hf_token: container.querySelector("#asd-hf-token").value
+                        }) });
+                        const data = await res.json();
+                        if (data.status !== "success") { btn.innerText = "❌ Error"; return; }
+                        prefetchId = data.id;
+                        renderPrefetch(data);
+                        if (data.unresolved && data.unresolved.length) console.log("[AcademiaSD] Models without download URL:", data.unresolved);
+                        checkAllRows();
+                    } catch (err) { btn.innerText = "❌ Error"; }
+                });
+
                 container.querySelector("#asd-btn-savetokens").addEventListener("click", async (e) => {
                     const btn = e.target;
                     try {
@@ -474,7 +581,7 @@ app.registerExtension({
                             data.data.forEach(item => addRow(item, true));
                             currentPreset = presetSel.value;
                             forceResize();
-                            setTimeout(() => { Array.from(_this.rowsContainer.children).forEach((r, idx) => setTimeout(() => checkRowStatus(r), idx * 200)); }, 500);
+                            setTimeout(() => checkAllRows(), 500);
                         }
                     } catch(e){}
                 });
@@ -563,7 +670,7 @@ app.registerExtension({
                             _this.rowsContainer.innerHTML = "";
                             data.forEach(item => addRow(item, true));
                             forceResize();
-                            setTimeout(() => { Array.from(_this.rowsContainer.children).forEach((r, idx) => setTimeout(() => checkRowStatus(r), idx * 200)); }, 500);
+                            setTimeout(() => checkAllRows(), 500);
                         } catch(err) { alert("Invalid JSON file."); }
                     };
                     reader.readAsText(file);
@@ -594,7 +701,7 @@ app.registerExtension({
                         if (this.restored_models && this.restored_models.length > 0) {
                             this.rowsContainer.innerHTML = "";
                             this.restored_models.forEach(m => addRow(m, true));
-                            setTimeout(() => { Array.from(this.rowsContainer.children).forEach((r, idx) => setTimeout(() => checkRowStatus(r), idx * 200)); }, 1000);
+                            setTimeout(() => checkAllRows(), 1000);
                         } else {
                             if (this.rowsContainer.children.length === 0) {
                                 addRow();
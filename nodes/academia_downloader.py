@@ -1,10 +1,21 @@
 import os
 import asyncio
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import urllib.parse
 import re
 import json
 import math
+import hashlib
+import shutil
+import time
+import threading
+import itertools
+import uuid
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from server import PromptServer
 from aiohttp import web
 import folder_paths
@@ -13,11 +24,14 @@ HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 }
 
-ACTIVE_DOWNLOADS = {}
 TOKENS_FILE = os.path.join(folder_paths.base_path, "models", "academia_tokens.json")
+MODEL_EXTENSIONS = (".safetensors", ".gguf", ".ckpt", ".pt", ".bin", ".pth", ".onnx", ".sft")
 PRESETS_DIR = os.path.join(folder_paths.base_path, "models", "academia_presets")
 os.makedirs(PRESETS_DIR, exist_ok=True)
-URL_INFO_CACHE = {} 
+URL_CACHE_FILE = os.path.join(folder_paths.base_path, "models", "academia_url_cache.json")
+CONTENT_INDEX_FILE = os.path.join(folder_paths.base_path, "models", "academia_content_index.json")
+CONVERSIONS_FILE = os.path.join(folder_paths.base_path, "models", "academia_conversions.json")
+PICKLE_EXTENSIONS = (".ckpt", ".pt", ".bin", ".pth")
 
 def format_size(size_bytes):
     try:
@@ -39,52 +53,387 @@ def get_headers_with_auth(url, civitai_token="", hf_token=""):
         req_headers["Authorization"] = f"Bearer {hf_token}"
     return req_headers
 
+class UrlInfoCache:
+    """Disk-backed LRU of remote file metadata (filename, size in bytes, ETag, Last-Modified).
+
+    Entries younger than url_cache_ttl_hours are served without touching the network; older ones
+    are revalidated with If-None-Match so an unchanged file costs a single 304.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_timer = None
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = OrderedDict(json.load(f))
+            except Exception as e:
+                print(f"[AcademiaSD] ⚠️ Could not read URL cache: {e}")
+
+    def get(self, url):
+        with self._lock:
+            entry = self.entries.get(url)
+            if entry is not None: self.entries.move_to_end(url)
+            return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry.get("checked_at", 0) < DOWNLOAD_SETTINGS["url_cache_ttl_hours"] * 3600
+
+    def put(self, url, info):
+        with self._lock:
+            info["checked_at"] = time.time()
+            self.entries[url] = info
+            self.entries.move_to_end(url)
+            while len(self.entries) > max(1, DOWNLOAD_SETTINGS["url_cache_max_entries"]):
+                self.entries.popitem(last=False)
+        self._save_later()
+
+    def touch(self, url):
+        with self._lock:
+            if url in self.entries: self.entries[url]["checked_at"] = time.time()
+        self._save_later()
+
+    def _save_later(self):
+        # Agrupamos las escrituras: al abrir un preset llegan muchas actualizaciones seguidas
+        with self._lock:
+            if self._save_timer is not None: return
+            self._save_timer = threading.Timer(2.0, self.save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def save(self):
+        with self._lock:
+            self._save_timer = None
+            data = dict(self.entries)
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"[AcademiaSD] ⚠️ Could not save URL cache: {e}")
+
+URL_INFO_CACHE = UrlInfoCache(URL_CACHE_FILE)
+NOT_MODIFIED = object()
+
+def filename_from_response(response):
+    fname = None
+    cd = response.headers.get('Content-Disposition')
+    if cd:
+        match = re.search(r'filename=["\']?([^;"\']+)', cd)
+        if match: fname = os.path.basename(match.group(1).strip())
+        
+    if not fname:
+        parsed = urllib.parse.urlparse(response.url)
+        fname = os.path.basename(parsed.path)
+        if not fname or fname.isdigit():
+            fname = (fname if fname else "model") + ".safetensors"
+    return fname
+
+def probe_url(url, civitai_token="", hf_token="", etag=None):
+    """Reads remote metadata with HEAD, falling back to a one-byte ranged GET when HEAD is refused or incomplete."""
+    req_headers = get_headers_with_auth(url, civitai_token, hf_token)
+    if etag: req_headers["If-None-Match"] = etag
+    response = HTTP.head(url, allow_redirects=True, headers=req_headers, timeout=8)
+    if response.status_code == 304: return NOT_MODIFIED
+
+    size_bytes = None
+    if response.ok and response.headers.get('Content-Length'):
+        size_bytes = int(response.headers['Content-Length'])
+    else:
+        # Los enlaces firmados (S3/R2, la redirección de Civitai) solo aceptan el método firmado y responden 403 a HEAD:
+        # la autenticación se decide con el GET
+        req_headers.pop("If-None-Match", None)
+        req_headers["Range"] = "bytes=0-0"
+        with HTTP.get(url, stream=True, allow_redirects=True, headers=req_headers, timeout=8) as response:
+            content_range = response.headers.get('Content-Range', '')
+            if response.status_code == 206 and '/' in content_range and not content_range.endswith('/*'):
+                size_bytes = int(content_range.rsplit('/', 1)[1])
+            elif response.status_code == 200 and response.headers.get('Content-Length'):
+                size_bytes = int(response.headers['Content-Length'])
+
+    if response.status_code in [401, 403] or "civitai.com/login" in response.url:
+        return {"auth_required": True}
+    response.raise_for_status()
+
+    return {
+        "filename": filename_from_response(response),
+        "size_bytes": size_bytes,
+        "etag": response.headers.get('ETag'),
+        "last_modified": response.headers.get('Last-Modified'),
+        "accept_ranges": response.headers.get('Accept-Ranges', '').lower() == 'bytes' or response.status_code == 206,
+    }
+
+def get_url_metadata(url, civitai_token="", hf_token=""):
+    """Cached remote metadata for url: a dict, {"auth_required": True}, or None if the URL cannot be probed."""
+    if not url or not url.startswith(('http://', 'https://')):
+        return None
+    entry = URL_INFO_CACHE.get(url)
+    if entry is not None and URL_INFO_CACHE.is_fresh(entry):
+        return entry
+    try:
+        info = probe_url(url, civitai_token, hf_token, etag=entry.get("etag") if entry else None)
+    except Exception:
+        return entry  # Mejor un dato caducado que ninguno si el servidor no responde
+    if info is NOT_MODIFIED:
+        URL_INFO_CACHE.touch(url)
+        return entry
+    if info.get("auth_required"):
+        return info
+    URL_INFO_CACHE.put(url, info)
+    return info
+
 def get_file_info_from_url(url, civitai_token="", hf_token=""):
     if not url or not url.startswith(('http://', 'https://')):
         return None, "0 B"
-        
-    if url in URL_INFO_CACHE:
-        return URL_INFO_CACHE[url]["filename"], URL_INFO_CACHE[url]["size"]
+    meta = get_url_metadata(url, civitai_token, hf_token)
+    if meta is None: return None, "Unknown"
+    if meta.get("auth_required"): return None, "Auth Required"
+    size_bytes = meta.get("size_bytes")
+    return meta.get("filename"), format_size(size_bytes) if size_bytes else "Unknown"
 
-    try:
-        req_headers = get_headers_with_auth(url, civitai_token, hf_token)
-        response = requests.get(url, stream=True, allow_redirects=True, headers=req_headers, timeout=8)
-        response.close()
-        
-        if response.status_code in [401, 403] or "civitai.com/login" in response.url:
-            return None, "Auth Required"
+# --- HASHES PUBLICADOS (HuggingFace LFS / Civitai) ---
+HF_RESOLVE_RE = re.compile(r"huggingface\.co/([^/]+/[^/?#]+)/resolve/([^/?#]+)/([^?#]+)")
+CIVITAI_DOWNLOAD_RE = re.compile(r"civitai\.com/api/download/models/(\d+)")
+API_CACHE_TTL = 600
+_API_CACHE = {}
 
-        size_bytes = response.headers.get('Content-Length')
-        formatted_size = format_size(size_bytes) if size_bytes else "Unknown"
+def _cached_api_json(api_url, headers):
+    hit = _API_CACHE.get(api_url)
+    if hit and time.time() - hit[0] < API_CACHE_TTL: return hit[1]
+    res = HTTP.get(api_url, headers=headers, timeout=10)
+    if res.status_code != 200: return None
+    payload = res.json()
+    _API_CACHE[api_url] = (time.time(), payload)
+    return payload
 
-        fname = None
-        cd = response.headers.get('Content-Disposition')
-        if cd:
-            match = re.search(r'filename=["\']?([^;"\']+)', cd)
-            if match: fname = os.path.basename(match.group(1).strip())
-            
-        if not fname:
-            parsed = urllib.parse.urlparse(response.url)
-            fname = os.path.basename(parsed.path)
-            if not fname or fname.isdigit():
-                fname = (fname if fname else "model") + ".safetensors"
-
-        URL_INFO_CACHE[url] = {"filename": fname, "size": formatted_size}
-        return fname, formatted_size
+def hf_repo_siblings(repo_id, revision, hf_token=""):
+    """File list of a HuggingFace repo with sizes and LFS hashes (blobs=true)."""
+    headers = HEADERS.copy()
+    if hf_token: headers["Authorization"] = f"Bearer {hf_token}"
+    payload = _cached_api_json(f"https://huggingface.co/api/models/{repo_id}/revision/{revision}?blobs=true", headers)
+    return payload.get("siblings", []) if payload else []
+
+def get_expected_sha256(url, filename, civitai_token="", hf_token=""):
+    """SHA-256 published upstream for url (HF LFS metadata or Civitai file hashes), or None if unknown."""
+    entry = URL_INFO_CACHE.get(url)
+    if entry and entry.get("sha256"): return entry["sha256"]
+    digest = None
+    try:
+        m = HF_RESOLVE_RE.search(url)
+        if m:
+            repo_id, revision, path = m.group(1), m.group(2), urllib.parse.unquote(m.group(3))
+            for s in hf_repo_siblings(repo_id, revision, hf_token):
+                if s.get("rfilename") == path:
+                    digest = (s.get("lfs") or {}).get("sha256")
+                    break
+        m = CIVITAI_DOWNLOAD_RE.search(url)
+        if m:
+            headers = get_headers_with_auth(url, civitai_token, hf_token)
+            payload = _cached_api_json(f"https://civitai.com/api/v1/model-versions/{m.group(1)}", headers) or {}
+            files = payload.get("files", [])
+            matches = [f for f in files if f.get("name") == filename] or (files if len(files) == 1 else [])
+            if matches: digest = (matches[0].get("hashes") or {}).get("SHA256")
     except Exception as e:
-        return None, "Unknown"
+        print(f"[AcademiaSD] ⚠️ Could not fetch upstream hash for {filename}: {e}")
+    if digest:
+        digest = digest.lower()
+        if entry is not None:
+            entry["sha256"] = digest
+            URL_INFO_CACHE.put(url, entry)
+    return digest
+
+# --- ÍNDICE DE CARPETAS DE MODELOS ---
+class ModelFolderIndex:
+    """In-memory listing of the model directories, used to answer (folder_name, subfolder, filename) lookups.
+
+    Every listed directory remembers its mtime. Adding, removing or renaming a file bumps it, so a
+    directory is only re-listed after it changed. mtimes are re-checked at most every RECHECK seconds,
+    so a burst of lookups (a batch check) is served from dictionaries without touching the disk.
+    """
+    RECHECK = 2.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dirs = {}
+
+    def _listing(self, dir_path):
+        now = time.time()
+        with self._lock:
+            entry = self._dirs.get(dir_path)
+            if entry is not None and now - entry["checked"] < self.RECHECK:
+                return entry["files"]
+        try: mtime = os.stat(dir_path).st_mtime_ns
+        except OSError: mtime = None
+        if entry is not None and entry["mtime"] == mtime:
+            entry["checked"] = now
+            return entry["files"]
+        files = {}
+        if mtime is not None:
+            try:
+                with os.scandir(dir_path) as it:
+                    for de in it:
+                        try:
+                            if de.is_file(): files[os.path.normcase(de.name)] = (de.path, de.stat().st_size)
+                        except OSError: pass
+            except OSError: pass
+        with self._lock:
+            self._dirs[dir_path] = {"mtime": mtime, "files": files, "checked": now}
+        return files
+
+    def lookup(self, folder_name, subfolder, filename):
+        """(full_path, size_bytes) of the first match across the folder's paths, or None."""
+        key = os.path.normcase(filename)
+        for base_path in folder_paths.get_folder_paths(folder_name) or []:
+            check_path = base_path
+            if subfolder:
+                check_path = os.path.join(check_path, subfolder.replace("..", "").strip("\\/"))
+            dir_path = os.path.normpath(check_path)
+            listing = self._listing(dir_path)
+            hit = listing.get(key)
+            if hit is None:
+                # Un modelo convertido a safetensors cuenta como presente con cualquiera de sus dos nombres
+                alias = CONVERSIONS.alias_name(dir_path, filename)
+                if alias: hit = listing.get(os.path.normcase(alias))
+            if hit is not None: return hit
+        return None
+
+    def invalidate(self, dir_path=None):
+        with self._lock:
+            if dir_path is None: self._dirs.clear()
+            else: self._dirs.pop(os.path.normpath(dir_path), None)
+
+    def rebuild(self):
+        """Drops everything and re-lists the root of every registered model folder."""
+        self.invalidate()
+        count = 0
+        for name in list(folder_paths.folder_names_and_paths.keys()):
+            for base_path in folder_paths.get_folder_paths(name) or []:
+                count += len(self._listing(os.path.normpath(base_path)))
+        return {"directories": len(self._dirs), "files": count}
+
+MODEL_INDEX = ModelFolderIndex()
+
+# --- ALMACÉN DIRECCIONADO POR CONTENIDO (deduplicación) ---
+class ContentStore:
+    """Maps content keys ("sha256:<hex>") to model files already on disk.
+
+    A requested file whose published SHA-256 is already present is materialized with a
+    hardlink (or a copy when linking is not possible, e.g. across drives) instead of downloaded.
+    ETags are not used: they only identify one resource and are often built from mtime and size.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.data = {"by_key": {}, "stats": {"links": 0, "copies": 0, "reclaimed_bytes": 0, "bandwidth_saved_bytes": 0}}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                # Índices antiguos también guardaban claves "etag:"; ya no son fiables para deduplicar
+                self.data["by_key"].update({k: v for k, v in saved.get("by_key", {}).items() if k.startswith("sha256:")})
+                self.data["stats"].update(saved.get("stats", {}))
+            except Exception as e:
+                print(f"[AcademiaSD] ⚠️ Could not read content index: {e}")
+
+    @staticmethod
+    def keys_for(sha256=None):
+        return [f"sha256:{sha256.lower()}"] if sha256 else []
+
+    def save(self):
+        with self._lock:
+            data = json.loads(json.dumps(self.data))
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"[AcademiaSD] ⚠️ Could not save content index: {e}")
+
+    def register(self, file_path, sha256=None, save=True):
+        keys = self.keys_for(sha256)
+        if not keys: return
+        with self._lock:
+            for key in keys:
+                paths = self.data["by_key"].setdefault(key, [])
+                if file_path not in paths: paths.append(file_path)
+        if save: self.save()
+
+    def find(self, keys, size_bytes=None):
+        """First registered file for any key that still exists with the expected size (required)."""
+        if not size_bytes: return None
+        with self._lock:
+            candidates = [p for key in keys for p in self.data["by_key"].get(key, [])]
+        for path in candidates:
+            try:
+                if os.path.isfile(path) and os.path.getsize(path) == size_bytes:
+                    return path
+            except OSError:
+                pass
+        return None
+
+    def materialize(self, source, file_path, sha256=None):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        size = os.path.getsize(source)
+        try:
+            os.link(source, file_path)
+            method = "hardlink"
+        except OSError:
+            shutil.copy2(source, file_path)
+            method = "copy"
+        if sha256: write_sha256_sidecar(file_path, sha256)
+        with self._lock:
+            stats = self.data["stats"]
+            stats["links" if method == "hardlink" else "copies"] += 1
+            stats["bandwidth_saved_bytes"] += size
+            if method == "hardlink": stats["reclaimed_bytes"] += size
+        self.register(file_path, sha256)
+        MODEL_INDEX.invalidate(os.path.dirname(file_path))
+        print(f"[AcademiaSD] 🔗 {os.path.basename(file_path)} already on disk, materialized by {method} from {source}")
+        return method
+
+    def scan_sidecars(self):
+        """Registers every model that has a valid .sha256 sidecar under the model folders."""
+        found = 0
+        for name in list(folder_paths.folder_names_and_paths.keys()):
+            for base_path in folder_paths.get_folder_paths(name) or []:
+                for root, _, files in os.walk(base_path):
+                    for fname in files:
+                        if not fname.endswith(".sha256"): continue
+                        model_path = os.path.join(root, fname[:-len(".sha256")])
+                        digest = read_sha256_sidecar(model_path) if os.path.isfile(model_path) else None
+                        if digest:
+                            self.register(model_path, digest, save=False)
+                            found += 1
+        self.save()
+        return found
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.data["stats"])
+            stats["indexed_keys"] = len(self.data["by_key"])
+        stats["reclaimed"] = format_size(stats["reclaimed_bytes"])
+        stats["bandwidth_saved"] = format_size(stats["bandwidth_saved_bytes"])
+        return stats
+
+CONTENT_STORE = ContentStore(CONTENT_INDEX_FILE)
+
+def find_duplicate(url, filename, civitai_token="", hf_token=""):
+    """Existing file with the same published SHA-256 and size as url, plus that hash, or (None, None)."""
+    meta = get_url_metadata(url, civitai_token, hf_token) or {}
+    if meta.get("auth_required"): return None, None
+    sha256 = get_expected_sha256(url, filename, civitai_token, hf_token)
+    if not sha256: return None, None
+    return CONTENT_STORE.find(CONTENT_STORE.keys_for(sha256), meta.get("size_bytes")), sha256
+
+def find_existing_file_info(folder_name, subfolder, filename):
+    return MODEL_INDEX.lookup(folder_name, subfolder, filename)
 
 def find_existing_file(folder_name, subfolder, filename):
-    paths = folder_paths.get_folder_paths(folder_name)
-    if not paths: return None
-    for base_path in paths:
-        check_path = base_path
-        if subfolder:
-            check_path = os.path.join(check_path, subfolder.replace("..", "").strip("\\/"))
-        full_file_path = os.path.join(check_path, filename)
-        if os.path.exists(full_file_path):
-            return full_file_path
-    return None
+    hit = MODEL_INDEX.lookup(folder_name, subfolder, filename)
+    return hit[0] if hit else None
 
 def get_download_target_path(folder_name, subfolder):
     paths = folder_paths.get_folder_paths(folder_name)
@@ -97,30 +446,944 @@ def get_download_target_path(folder_name, subfolder):
         target_base = os.path.join(target_base, subfolder.replace("..", "").strip("\\/"))
     return target_base
 
-def background_download_task(url, file_path, civitai_token="", hf_token=""):
+# --- MOTOR DE DESCARGA SEGMENTADA ---
+DOWNLOAD_SETTINGS_FILE = os.path.join(folder_paths.base_path, "models", "academia_downloader_settings.json")
+DOWNLOAD_SETTINGS = {
+    "connections_per_download": 8,  # Conexiones paralelas (rangos de bytes) por archivo
+    "max_total_connections": 16,    # Tope global de conexiones abiertas entre todas las descargas
+    "segment_mb": 64,               # Tamaño de cada rango; las conexiones los piden en orden y los archivos pequeños van en un solo stream
+    "segment_retries": 3,
+    "max_concurrent_downloads": 3,  # Archivos descargándose a la vez; el resto espera en la cola
+    "per_host_limits": {"huggingface.co": 2, "civitai.com": 2},
+    "queue_order": "fifo",          # "fifo" o "priority"
+    "url_cache_ttl_hours": 24,      # Tras este tiempo los metadatos remotos se revalidan con If-None-Match
+    "url_cache_max_entries": 2000,
+    "http_pool_size": 32,           # Conexiones keep-alive por host
+    "http_host_pool_sizes": {"huggingface.co": 16, "civitai.com": 8},
+    "http_retries": 3,              # Reintentos de conexión / 429 / 5xx con backoff exponencial
+    "http_backoff": 0.5,
+    "disk_reserve_mb": 1024,        # Espacio que siempre dejamos libre en el disco de destino
+    "convert_to_safetensors": False,  # Convierte .ckpt/.pt/.bin/.pth descargados a .safetensors en segundo plano
+    "convert_delete_original": False, # Borra el archivo original tras convertirlo (por defecto se conserva)
+    "bandwidth_limit_mb_s": 0.0,    # Límite global de ancho de banda en MB/s (0 = sin límite)
+    "per_download_limit_mb_s": 0.0, # Límite por descarga en MB/s (0 = sin límite)
+    "pause_while_executing": False, # Detiene las transferencias mientras ComfyUI ejecuta un prompt
+}
+CHUNK_SIZE = 1024 * 1024
+MB = 1024 * 1024
+
+class DownloadAborted(Exception):
+    pass
+
+class ConnectionLimiter:
+    """Resizable semaphore shared by every download connection."""
+    def __init__(self, limit):
+        self._cond = threading.Condition()
+        self.limit = max(1, int(limit))
+        self.in_use = 0
+
+    def set_limit(self, limit):
+        with self._cond:
+            self.limit = max(1, int(limit))
+            self._cond.notify_all()
+
+    def __enter__(self):
+        with self._cond:
+            while self.in_use >= self.limit:
+                self._cond.wait()
+            self.in_use += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self.in_use -= 1
+            self._cond.notify()
+        return False
+
+def load_download_settings():
+    if os.path.exists(DOWNLOAD_SETTINGS_FILE):
+        try:
+            with open(DOWNLOAD_SETTINGS_FILE, "r") as f:
+                saved = json.load(f)
+            for k in DOWNLOAD_SETTINGS:
+                if k in saved: DOWNLOAD_SETTINGS[k] = type(DOWNLOAD_SETTINGS[k])(saved[k])
+        except Exception as e:
+            print(f"[AcademiaSD] ⚠️ Could not read downloader settings: {e}")
+
+def persist_download_settings():
+    tmp = DOWNLOAD_SETTINGS_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(DOWNLOAD_SETTINGS, f, indent=4)
+    os.replace(tmp, DOWNLOAD_SETTINGS_FILE)
+
+load_download_settings()
+CONNECTION_LIMITER = ConnectionLimiter(DOWNLOAD_SETTINGS["max_total_connections"])
+
+class TokenBucket:
+    """Byte-rate limiter with a one second burst; a rate of 0 means unlimited.
+
+    Callers charge the bytes they have just read and sleep off the debt outside the lock,
+    so every connection sharing a bucket gets its fair part of the rate.
+    """
+    def __init__(self, rate=0):
+        self._lock = threading.Lock()
+        self.rate = 0.0
+        self.tokens = 0.0
+        self._stamp = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = max(0.0, float(rate))
+            self.tokens = min(self.tokens, self.rate)
+            self._stamp = time.monotonic()
+
+    def consume(self, n):
+        """Charges n bytes and returns how many seconds the caller should wait."""
+        with self._lock:
+            if self.rate <= 0: return 0.0
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self._stamp) * self.rate) - n
+            self._stamp = now
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+class BandwidthShaper:
+    """Global and per-download bandwidth limits, plus an optional hold while a prompt is executing."""
+    def __init__(self):
+        self.bucket = TokenBucket()
+        self._lock = threading.Lock()
+        self.throttled_seconds = 0.0
+        self.held_seconds = 0.0
+        self.configure()
+
+    def configure(self):
+        self.bucket.set_rate(DOWNLOAD_SETTINGS["bandwidth_limit_mb_s"] * MB)
+
+    @staticmethod
+    def prompt_running():
+        try: return bool(PromptServer.instance.prompt_queue.currently_running)
+        except Exception: return False
+
+    def throttle(self, n, progress):
+        job = progress.job
+        wait = self.bucket.consume(n)
+        if job is not None: wait = max(wait, job.bucket.consume(n))
+        if wait > 0:
+            progress.aborted.wait(wait)
+            with self._lock: self.throttled_seconds += wait
+        if not DOWNLOAD_SETTINGS["pause_while_executing"] or not self.prompt_running(): return
+        # Las conexiones quedan abiertas pero sin leer; si el servidor las cierra, el segmento se reintenta desde donde iba
+        start = time.time()
+        if job is not None:
+            job.held = True
+            job.publish(force=True)
+        while self.prompt_running() and DOWNLOAD_SETTINGS["pause_while_executing"] and not progress.aborted.is_set():
+            progress.aborted.wait(0.5)
+        with self._lock: self.held_seconds += time.time() - start
+        if job is not None:
+            job.held = False
+            job.reset_rate()
+            job.publish(force=True)
+
+    def stats(self):
+        with self._lock:
+            return {"bandwidth_limit_mb_s": DOWNLOAD_SETTINGS["bandwidth_limit_mb_s"],
+                    "per_download_limit_mb_s": DOWNLOAD_SETTINGS["per_download_limit_mb_s"],
+                    "pause_while_executing": DOWNLOAD_SETTINGS["pause_while_executing"],
+                    "prompt_running": self.prompt_running(),
+                    "throttled_seconds": round(self.throttled_seconds, 1), "held_seconds": round(self.held_seconds, 1)}
+
+BANDWIDTH = BandwidthShaper()
+
+class HttpClient:
+    """Shared keep-alive session for every downloader request, with per-host pools and retry/backoff.
+
+    Reuse is measured from urllib3's own pool counters: every request that did not need a
+    new connection skipped a TCP+TLS handshake. Reconfiguring swaps in a new session; the old
+    one is closed once its last open response is, and its counters are kept in the totals.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._adapters = {}  # sesión -> adaptadores (la actual y las retiradas con respuestas abiertas)
+        self._in_use = {}    # sesión -> peticiones o streams aún abiertos
+        self._retired = {}   # host -> contadores de las sesiones ya cerradas
+        self.session = None
+        self.configure()
+
+    def _retry(self):
+        return Retry(total=DOWNLOAD_SETTINGS["http_retries"], backoff_factor=DOWNLOAD_SETTINGS["http_backoff"],
+                     status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset(["HEAD", "GET"]),
+                     respect_retry_after_header=True, raise_on_status=False)
+
+    def configure(self):
+        session = requests.Session()
+        adapters = []
+        pool_size = max(DOWNLOAD_SETTINGS["http_pool_size"], DOWNLOAD_SETTINGS["max_total_connections"])
+        default = HTTPAdapter(pool_connections=32, pool_maxsize=pool_size, max_retries=self._retry())
+        session.mount("http://", default)
+        session.mount("https://", default)
+        adapters.append(default)
+        for host, size in DOWNLOAD_SETTINGS["http_host_pool_sizes"].items():
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, int(size)), max_retries=self._retry())
+            session.mount(f"https://{host}/", adapter)
+            adapters.append(adapter)
+        with self._lock:
+            old, self.session = self.session, session
+            self._adapters[session] = adapters
+            self._in_use[session] = 0
+            # La sesión anterior sigue viva mientras alguna descarga en curso la use
+            retired = old is not None and self._retire_if_idle(old)
+        if retired: old.close()
+
+    def _retire_if_idle(self, session):
+        """With the lock held: forgets an idle, replaced session and folds its counters into the totals."""
+        if session is self.session or self._in_use[session] > 0: return False
+        self._count(self._adapters.pop(session), self._retired)
+        del self._in_use[session]
+        return True
+
+    def _release(self, session):
+        with self._lock:
+            self._in_use[session] -= 1
+            retired = self._retire_if_idle(session)
+        if retired: session.close()
+
+    def _request(self, method, url, **kwargs):
+        with self._lock:
+            session = self.session
+            self._in_use[session] += 1
+        try:
+            response = getattr(session, method)(url, **kwargs)
+        except BaseException:
+            self._release(session)
+            raise
+        if not kwargs.get("stream"):
+            self._release(session)
+            return response
+        # Un stream ocupa la sesión hasta que se cierra la respuesta (todos los usos van en un "with")
+        close, released = response.close, []
+        def close_and_release():
+            try: close()
+            finally:
+                if not released:
+                    released.append(True)
+                    self._release(session)
+        response.close = close_and_release
+        return response
+
+    def get(self, url, **kwargs):
+        return self._request("get", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self._request("head", url, **kwargs)
+
+    @staticmethod
+    def _count(adapters, by_host):
+        for adapter in adapters:
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None: continue
+                entry = by_host.setdefault(pool.host, {"requests": 0, "new_connections": 0})
+                entry["requests"] += pool.num_requests
+                entry["new_connections"] += pool.num_connections
+
+    def stats(self):
+        with self._lock:
+            by_host = {host: dict(entry) for host, entry in self._retired.items()}
+            adapters = [a for group in self._adapters.values() for a in group]
+            sessions = len(self._adapters)
+        self._count(adapters, by_host)
+        for entry in by_host.values():
+            entry["reused"] = max(0, entry["requests"] - entry["new_connections"])
+        total_req = sum(e["requests"] for e in by_host.values())
+        total_new = sum(e["new_connections"] for e in by_host.values())
+        return {"requests": total_req, "new_connections": total_new, "reused": max(0, total_req - total_new),
+                "open_sessions": sessions, "by_host": by_host}
+
+HTTP = HttpClient()
+
+class DownloadProgress:
+    def __init__(self, job, total, done=0):
+        self.job = job
+        self.total = total
+        self.done = done
+        self.aborted = job.stop if job is not None else threading.Event()
+        self.hasher = None
+        self._lock = threading.Lock()
+        if job is not None:
+            job.total_bytes, job.done_bytes = total, done
+            job.reset_rate()
+        self._publish()
+
+    def _publish(self):
+        if self.job is not None:
+            self.job.total_bytes, self.job.done_bytes = self.total, self.done
+            if self.total > 0:
+                self.job.progress = int((self.done / self.total) * 100)
+            self.job.publish()
+
+    def add(self, n):
+        with self._lock:
+            self.done += n
+            self._publish()
+        if self.hasher is not None: self.hasher.notify()
+        BANDWIDTH.throttle(n, self)
+
+class StreamingHasher:
+    """SHA-256 of a segmented .temp file, computed while it downloads.
+
+    A background thread follows the contiguous completed prefix recorded in the journal and
+    hashes each block moments after it is written, while it is still in the page cache, so
+    verification never needs a second pass over the finished file. After a resume the prefix
+    already on disk is hashed once at start-up.
+    """
+    BLOCK = 8 * 1024 * 1024
+
+    def __init__(self, temp_path, journal, total_length):
+        self.temp_path = temp_path
+        self.journal = journal
+        self.total = total_length
+        self.sha = hashlib.sha256()
+        self.hashed_to = 0
+        self.error = None
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name="academia_hash")
+        self._thread.start()
+
+    def frontier(self):
+        for start, end, offset in self.journal.segments:
+            if offset <= end: return offset
+        return self.total
+
+    def notify(self):
+        self._wake.set()
+
+    def _run(self):
+        try:
+            with open(self.temp_path, "rb") as f:
+                while not self._stopped and self.hashed_to < self.total:
+                    target = self.frontier()
+                    if self.hashed_to < target:
+                        f.seek(self.hashed_to)
+                        block = f.read(min(self.BLOCK, target - self.hashed_to))
+                        if not block: raise IOError(f"Unexpected end of file at byte {self.hashed_to}")
+                        self.sha.update(block)
+                        self.hashed_to += len(block)
+                        continue
+                    self._wake.wait(0.5)
+                    self._wake.clear()
+        except Exception as e:
+            self.error = e
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+        self._thread.join()
+
+    def finish(self):
+        self._wake.set()
+        self._thread.join()
+        if self.error is not None: raise self.error
+        if self.hashed_to != self.total: raise IOError("Hashing stopped before the end of the file")
+        return self.sha.hexdigest()
+
+class DownloadJournal:
+    """Sidecar next to a .temp file recording the upstream validators and the byte ranges already on disk.
+
+    Each segment is stored as [start, end, next_offset] (inclusive end); the bytes in
+    [start, next_offset) are complete, so a restart only has to request the remainder.
+    """
+    SAVE_INTERVAL = 2.0
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+
+    @staticmethod
+    def path_for(temp_path):
+        return temp_path + ".json"
+
+    @classmethod
+    def load(cls, temp_path):
+        path = cls.path_for(temp_path)
+        if not os.path.exists(path): return None
+        try:
+            with open(path, "r") as f:
+                return cls(path, json.load(f))
+        except Exception:
+            return None
+
+    @classmethod
+    def create(cls, temp_path, url, etag, last_modified, total_length, segments):
+        return cls(cls.path_for(temp_path), {
+            "url": url, "etag": etag, "last_modified": last_modified, "total": total_length,
+            "segments": [[start, end, start] for start, end in segments],
+        })
+
+    @property
+    def segments(self):
+        return self.data["segments"]
+
+    def matches(self, url, etag, last_modified, total_length):
+        d = self.data
+        if d.get("url") != url or d.get("total") != total_length: return False
+        # Sin ETag ni Last-Modified no podemos garantizar que el archivo remoto sea el mismo
+        if etag or d.get("etag"): return etag == d.get("etag")
+        if last_modified or d.get("last_modified"): return last_modified == d.get("last_modified")
+        return False
+
+    def bytes_done(self):
+        return sum(seg[2] - seg[0] for seg in self.segments)
+
+    def save(self, force=False):
+        with self._lock:
+            now = time.time()
+            if not force and now - self._last_save < self.SAVE_INTERVAL: return
+            self._last_save = now
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.data, f)
+            os.replace(tmp, self.path)
+
+    def remove(self):
+        try: os.remove(self.path)
+        except FileNotFoundError: pass
+
+def discard_partial(temp_path):
+    for p in (temp_path, DownloadJournal.path_for(temp_path)):
+        try: os.remove(p)
+        except FileNotFoundError: pass
+
+def plan_segments(total_length):
+    """Splits [0, total_length) into fixed-size inclusive byte ranges.
+
+    The connections take them in order, so the completed prefix of the file grows steadily
+    (which lets the hasher follow it) and a slow connection never leaves a long tail.
+    """
+    piece = max(1, DOWNLOAD_SETTINGS["segment_mb"]) * 1024 * 1024
+    return [(start, min(start + piece, total_length) - 1) for start in range(0, total_length, piece)]
+
+def write_all(f, data):
+    view = memoryview(data)
+    while view:
+        view = view[f.write(view):]
+
+# Respuestas de un enlace firmado del CDN que ha caducado
+EXPIRED_LINK_STATUS = (401, 403, 410)
+
+class LinkExpired(IOError):
+    pass
+
+class UpstreamChanged(IOError):
+    pass
+
+class ResolvedURL:
+    """Post-redirect URL of a segmented download, shared by its connections.
+
+    Signed CDN links (HF/Civitai) expire after a while. When a segment is refused, the first
+    connection to notice resolves the original URL again and the others pick up the new link.
+    """
+    def __init__(self, origin, headers, url):
+        self.origin = origin
+        self.headers = headers
+        self._lock = threading.Lock()
+        self.generation = 0
+        self._set(url)
+
+    def _set(self, url):
+        self.url = url
+        self.generation += 1  # Cuenta también las renovaciones que devuelven la misma URL
+        self.segment_headers = dict(self.headers)
+        # Las URLs firmadas del CDN rechazan la cabecera Authorization si cambia el host
+        if urllib.parse.urlparse(url).netloc != urllib.parse.urlparse(self.origin).netloc:
+            self.segment_headers.pop("Authorization", None)
+
+    def get(self):
+        with self._lock:
+            return self.url, self.segment_headers, self.generation
+
+    def refresh(self, stale_generation, journal):
+        with self._lock:
+            if self.generation != stale_generation: return  # Otra conexión ya lo renovó
+            with CONNECTION_LIMITER, HTTP.get(self.origin, stream=True, allow_redirects=True, headers=self.headers, timeout=30) as r:
+                if r.status_code in EXPIRED_LINK_STATUS and r.url != self.origin:
+                    # El CDN también rechaza el enlace recién firmado (p. ej. por límite): lo adoptamos igualmente
+                    # y los segmentos esperan; las respuestas 206 comprueban el ETag
+                    self._set(r.url)
+                    raise LinkExpired(f"Fresh download link refused (HTTP {r.status_code})")
+                r.raise_for_status()
+                total_length = int(r.headers.get('content-length') or 0)
+                if not journal.matches(self.origin, r.headers.get('etag'), r.headers.get('last-modified'), total_length):
+                    raise UpstreamChanged("Upstream file changed while downloading")
+                self._set(r.url)
+            print(f"[AcademiaSD] 🔑 Download link expired, resolved a fresh one for {os.path.basename(urllib.parse.urlparse(self.origin).path)}")
+
+def fetch_segment(source, temp_path, seg, progress, journal):
+    start, end = seg[0], seg[1]
+    attempt = 0
+    while seg[2] <= end:
+        if progress.aborted.is_set(): raise DownloadAborted()
+        url, headers, generation = source.get()
+        try:
+            seg_headers = dict(headers)
+            seg_headers["Range"] = f"bytes={seg[2]}-{end}"
+            with CONNECTION_LIMITER, HTTP.get(url, stream=True, headers=seg_headers, timeout=30) as r:
+                if r.status_code in EXPIRED_LINK_STATUS:
+                    raise LinkExpired(f"Download link refused (HTTP {r.status_code})")
+                if r.status_code != 206:
+                    raise IOError(f"Server ignored the Range request (HTTP {r.status_code})")
+                etag = r.headers.get('etag')
+                if etag and journal.data.get("etag") and etag != journal.data["etag"]:
+                    raise UpstreamChanged("Upstream file changed while downloading")
+                # Sin buffer: lo que el diario marca como completado ya está entregado al sistema operativo
+                with open(temp_path, "r+b", buffering=0) as f:
+                    f.seek(seg[2])
+                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                        if progress.aborted.is_set(): raise DownloadAborted()
+                        if not chunk: continue
+                        chunk = chunk[:end + 1 - seg[2]]
+                        write_all(f, chunk)
+                        seg[2] += len(chunk)
+                        progress.add(len(chunk))
+                        journal.save()
+                        if seg[2] > end: break
+            if seg[2] <= end:
+                raise IOError(f"Connection closed at byte {seg[2]} of segment {start}-{end}")
+        except (DownloadAborted, UpstreamChanged):
+            raise
+        except Exception as e:
+            attempt += 1
+            if attempt > DOWNLOAD_SETTINGS["segment_retries"]: raise
+            # Si el enlace nuevo también se rechaza (p. ej. límite del CDN) esperamos como en cualquier otro fallo
+            if isinstance(e, LinkExpired):
+                try: source.refresh(generation, journal)
+                except UpstreamChanged: raise
+                except Exception as refresh_error: e = refresh_error
+            print(f"[AcademiaSD] ⚠️ Segment {start}-{end} failed ({e}), retrying {attempt}/{DOWNLOAD_SETTINGS['segment_retries']}...")
+            time.sleep(min(2 ** attempt, 10))
+
+def download_segmented(source, temp_path, journal, progress):
+    pending = [seg for seg in journal.segments if seg[2] <= seg[1]]
+    errors = []
+    workers = max(1, min(DOWNLOAD_SETTINGS["connections_per_download"], len(pending)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="academia_dl") as pool:
+        futures = [pool.submit(fetch_segment, source, temp_path, seg, progress, journal) for seg in pending]
+        for fut in as_completed(futures):
+            try:
+                fut.result()
+            except Exception as e:
+                progress.aborted.set()
+                errors.append(e)
+    journal.save(force=True)
+    real_errors = [e for e in errors if not isinstance(e, DownloadAborted)]
+    if real_errors: raise real_errors[0]
+    if errors: raise errors[0]
+
+def download_single_stream(response, temp_path, progress, sha):
+    # Si el servidor comprime pese a pedir "identity", Content-Length cuenta bytes codificados:
+    # comparamos entonces los bytes leídos del socket, y el tamaño final es desconocido
+    expected = progress.total
+    encoded = response.headers.get("content-encoding", "identity").lower() not in ("", "identity")
+    if encoded: progress.total = 0
+    with open(temp_path, 'wb') as f:
+        if progress.total > 0 and preallocate(f, progress.total) and progress.job is not None:
+            progress.job.preallocated = True
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            if progress.aborted.is_set(): raise DownloadAborted()
+            if chunk:
+                f.write(chunk)
+                sha.update(chunk)
+                progress.add(len(chunk))
+    received = response.raw.tell() if encoded else progress.done
+    if expected > 0 and received != expected:
+        raise IOError(f"Connection closed after {received} of {expected} bytes")
+
+# --- CONTROL DE ESPACIO EN DISCO ---
+def preallocate(f, size):
+    """Reserves size bytes for f up front (posix_fallocate) so a large model is laid out contiguously.
+
+    Falls back to a plain truncate where fallocate is unavailable (Windows, some network filesystems).
+    Returns True if real blocks were reserved.
+    """
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+        return True
+    except (AttributeError, OSError):
+        f.truncate(size)
+        return False
+
+def _existing_dir(path):
+    path = os.path.abspath(path)
+    while not os.path.isdir(path):
+        parent = os.path.dirname(path)
+        if parent == path: break
+        path = parent
+    return path
+
+def allocated_bytes(path):
+    try: st = os.stat(path)
+    except OSError: return 0
+    return st.st_blocks * 512 if hasattr(st, "st_blocks") else st.st_size
+
+def bytes_still_needed(file_path, size_bytes):
+    """Bytes a download of size_bytes still has to claim on disk, discounting its preallocated or partial .temp."""
+    return max(0, size_bytes - allocated_bytes(file_path + ".temp"))
+
+def check_disk_space(file_path, size_bytes, exclude_url=None):
+    """None if the download fits on its volume next to the ones already in flight, else an error dict."""
+    if not size_bytes: return None
+    target_dir = _existing_dir(os.path.dirname(file_path))
+    free = shutil.disk_usage(target_dir).free
+    reserved = DOWNLOAD_QUEUE.reserved_bytes(os.stat(target_dir).st_dev, exclude_url)
+    need = bytes_still_needed(file_path, size_bytes)
+    margin = DOWNLOAD_SETTINGS["disk_reserve_mb"] * 1024 * 1024
+    if need + reserved + margin <= free: return None
+    return {"status": "error", "message": "insufficient_space", "required": need, "reserved_by_downloads": reserved, "available": free,
+            "detail": f"Not enough disk space for {os.path.basename(file_path)}: needs {format_size(need)}, {format_size(max(0, free - reserved - margin))} available after in-flight downloads."}
+
+def sha256_sidecar_path(file_path):
+    return file_path + ".sha256"
+
+def write_sha256_sidecar(file_path, digest):
+    try:
+        with open(sha256_sidecar_path(file_path), "w") as f:
+            f.write(f"{digest}  {os.path.basename(file_path)}\n")  # Formato compatible con sha256sum
+    except Exception as e:
+        print(f"[AcademiaSD] ⚠️ Could not write SHA-256 sidecar for {os.path.basename(file_path)}: {e}")
+
+def read_sha256_sidecar(file_path):
+    """Digest recorded at download time, or None if there is no sidecar or the file changed afterwards."""
+    sidecar = sha256_sidecar_path(file_path)
+    try:
+        if os.path.getmtime(sidecar) < os.path.getmtime(file_path): return None
+        with open(sidecar, "r") as f:
+            digest = f.read().split()[0].lower()
+        return digest if re.fullmatch(r"[0-9a-f]{64}", digest) else None
+    except Exception:
+        return None
+
+def background_download_task(url, file_path, civitai_token="", hf_token="", job=None):
+    """Downloads url into file_path. Returns True on success; job (if given) receives progress and stop requests."""
     temp_path = file_path + ".temp"
+    journal = None
     try:
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         req_headers = get_headers_with_auth(url, civitai_token, hf_token)
-        with requests.get(url, stream=True, allow_redirects=True, headers=req_headers) as r:
+        # Sin compresión: Content-Length y los rangos deben referirse a los bytes del archivo
+        req_headers["Accept-Encoding"] = "identity"
+        with CONNECTION_LIMITER, HTTP.get(url, stream=True, allow_redirects=True, headers=req_headers, timeout=30) as r:
             r.raise_for_status()
             total_length = r.headers.get('content-length')
             total_length = int(total_length) if total_length else 0
-            downloaded = 0
-            
-            with open(temp_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=1024*1024): 
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        if total_length > 0:
-                            ACTIVE_DOWNLOADS[url] = {"progress": int((downloaded / total_length) * 100)}
-        
+            etag, last_modified = r.headers.get('etag'), r.headers.get('last-modified')
+            final_url = r.url
+            ranged = total_length > 0 and r.headers.get('accept-ranges', '').lower() == 'bytes'
+
+            journal = DownloadJournal.load(temp_path)
+            if journal is not None:
+                if ranged and os.path.exists(temp_path) and journal.matches(url, etag, last_modified, total_length):
+                    print(f"[AcademiaSD] ⏯️ Resuming {os.path.basename(file_path)} at {format_size(journal.bytes_done())} of {format_size(total_length)}")
+                else:
+                    print(f"[AcademiaSD] ♻️ Upstream file changed or cannot be resumed, restarting {os.path.basename(file_path)}")
+                    discard_partial(temp_path)
+                    journal = None
+
+            no_space = check_disk_space(file_path, total_length, exclude_url=url)
+            if no_space: raise IOError(no_space["detail"])
+
+            if journal is None and ranged:
+                segments = plan_segments(total_length)
+                if len(segments) > 1:
+                    # Reservamos el archivo completo para que cada hilo escriba en su propio rango
+                    with open(temp_path, "wb") as f:
+                        if preallocate(f, total_length) and job is not None: job.preallocated = True
+                    journal = DownloadJournal.create(temp_path, url, etag, last_modified, total_length, segments)
+                    journal.save(force=True)
+
+            progress = DownloadProgress(job, total_length, journal.bytes_done() if journal else 0)
+            if journal is None:
+                sha = hashlib.sha256()
+                download_single_stream(r, temp_path, progress, sha)
+                digest = sha.hexdigest()
+
+        if journal is not None:
+            source = ResolvedURL(url, req_headers, final_url)
+            connections = min(DOWNLOAD_SETTINGS["connections_per_download"], len(journal.segments))
+            print(f"[AcademiaSD] ⬇️ {os.path.basename(file_path)}: {connections} parallel connections, {len(journal.segments)} ranges ({format_size(total_length)})")
+            hasher = StreamingHasher(temp_path, journal, total_length)
+            progress.hasher = hasher
+            try:
+                download_segmented(source, temp_path, journal, progress)
+            except BaseException:
+                hasher.stop()
+                raise
+            digest = hasher.finish()
+
+        expected_sha = get_expected_sha256(url, os.path.basename(file_path), civitai_token, hf_token)
+        if expected_sha and digest != expected_sha:
+            discard_partial(temp_path)
+            raise IOError(f"SHA-256 mismatch (expected {expected_sha}, got {digest}); the download was discarded")
+        if journal is not None: journal.remove()
+
         os.replace(temp_path, file_path)
+        write_sha256_sidecar(file_path, digest)
+        MODEL_INDEX.invalidate(os.path.dirname(file_path))
+        CONTENT_STORE.register(file_path, digest)
+        print(f"[AcademiaSD] ✅ {os.path.basename(file_path)} downloaded" + (" and verified (SHA-256)" if expected_sha else ""))
+        if DOWNLOAD_SETTINGS["convert_to_safetensors"] and file_path.lower().endswith(PICKLE_EXTENSIONS):
+            CONVERSIONS.submit(file_path)
+        return True
+    except DownloadAborted:
+        if job is not None and job.stop_reason == "pause" and os.path.exists(DownloadJournal.path_for(temp_path)):
+            print(f"[AcademiaSD] ⏸️ Paused {os.path.basename(file_path)}")
+        else:
+            # Una pausa que llega antes de crear el diario no deja nada reanudable
+            if job is not None: job.stop_reason = "cancel"
+            print(f"[AcademiaSD] ⏹️ Cancelled {os.path.basename(file_path)}")
+            discard_partial(temp_path)
     except Exception as e:
-        if os.path.exists(temp_path): os.remove(temp_path)
-    finally:
-        ACTIVE_DOWNLOADS.pop(url, None)
+        if job is not None: job.error = str(e)
+        if os.path.exists(DownloadJournal.path_for(temp_path)) and os.path.exists(temp_path):
+            print(f"[AcademiaSD] ⏸️ Download interrupted for {os.path.basename(file_path)}: {e}. It will resume on the next attempt.")
+        else:
+            print(f"[AcademiaSD] ❌ Download failed for {os.path.basename(file_path)}: {e}")
+            discard_partial(temp_path)
+    return False
+
+def get_resume_progress(file_path):
+    """Percentage already on disk for an interrupted download, or None if there is nothing to resume."""
+    temp_path = file_path + ".temp"
+    journal = DownloadJournal.load(temp_path)
+    if journal is None or not os.path.exists(temp_path) or not journal.data.get("total"): return None
+    return int(journal.bytes_done() * 100 / journal.data["total"])
+
+# --- COLA DE DESCARGAS ---
+def host_key(url):
+    """Maps a URL to the per_host_limits entry that governs it (subdomains included), or its own hostname."""
+    host = (urllib.parse.urlparse(url).hostname or "").lower()
+    for h in DOWNLOAD_SETTINGS["per_host_limits"]:
+        if host == h or host.endswith("." + h): return h
+    return host
+
+PROGRESS_EVENT = "academia.download.progress"
+PROGRESS_INTERVAL = 0.5  # Segundos mínimos entre eventos de progreso de una misma descarga
+
+class DownloadJob:
+    def __init__(self, url, file_path, civitai_token, hf_token, priority, seq):
+        self.url = url
+        self.file_path = file_path
+        self.civitai_token = civitai_token
+        self.hf_token = hf_token
+        self.priority = priority
+        self.seq = seq
+        self.host = host_key(url)
+        self.state = "queued"  # queued | downloading | paused | error (done / cancelled solo en el último evento)
+        self.progress = -1
+        self.done_bytes = 0
+        self.total_bytes = 0
+        self.speed = 0.0
+        self.eta = None
+        self.error = None
+        self.stop = threading.Event()
+        self.stop_reason = None
+        self.groups = []  # Grupos de precarga que siguen esta descarga (puede estar en varios)
+        self.expected_bytes = 0
+        self.preallocated = False
+        self.held = False
+        self.stopped_at = None  # Momento en que quedó en pausa o con error
+        self.limit_mb_s = None  # Límite propio fijado desde /academia/bandwidth; None = el de los ajustes
+        self.bucket = TokenBucket(DOWNLOAD_SETTINGS["per_download_limit_mb_s"] * MB)
+        self._last_emit = 0.0
+        self.reset_rate()
+
+    def set_limit(self, limit_mb_s):
+        self.limit_mb_s = limit_mb_s
+        self.bucket.set_rate((DOWNLOAD_SETTINGS["per_download_limit_mb_s"] if limit_mb_s is None else limit_mb_s) * MB)
+
+    def reset_rate(self):
+        self._rate_time, self._rate_done = time.time(), self.done_bytes
+        self.speed, self.eta = 0.0, None
+
+    def publish(self, force=False):
+        """Pushes the job state to the browser over the ComfyUI websocket, throttled to PROGRESS_INTERVAL."""
+        now = time.time()
+        if not force and now - self._last_emit < PROGRESS_INTERVAL: return
+        self._last_emit = now
+        elapsed = now - self._rate_time
+        if self.state == "downloading" and elapsed >= PROGRESS_INTERVAL:
+            instant = (self.done_bytes - self._rate_done) / elapsed
+            self.speed = instant if self.speed <= 0 else 0.5 * instant + 0.5 * self.speed
+            self._rate_time, self._rate_done = now, self.done_bytes
+            remaining = self.total_bytes - self.done_bytes
+            self.eta = int(remaining / self.speed) if self.speed > 0 and self.total_bytes > 0 else None
+        try:
+            PromptServer.instance.send_sync(PROGRESS_EVENT, self.to_dict())
+        except Exception:
+            pass
+        for group in list(self.groups): group.update(self, force)
+
+    def is_active(self):
+        return self.state in ("queued", "downloading")
+
+    def to_dict(self):
+        return {"url": self.url, "filename": os.path.basename(self.file_path), "state": self.state, "priority": self.priority,
+                "progress": self.progress, "done_bytes": self.done_bytes, "total_bytes": self.total_bytes,
+                "speed": int(self.speed), "eta": self.eta, "error": self.error, "held": self.held,
+                "limit_mb_s": DOWNLOAD_SETTINGS["per_download_limit_mb_s"] if self.limit_mb_s is None else self.limit_mb_s}
+
+class DownloadScheduler:
+    """Bounded download queue: global and per-host concurrency limits, FIFO or priority ordering, pause and cancel.
+
+    Each running download gets its own daemon thread so transfers never occupy the event loop's default executor.
+    Paused and failed jobs are forgotten after STOPPED_JOB_TTL; their partial file and journal stay on disk, so
+    requesting the same URL again still resumes it.
+    """
+    STOPPED_JOB_TTL = 3600
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._seq = itertools.count()
+        self.jobs = {}
+
+    def get(self, url):
+        with self._lock:
+            return self.jobs.get(url)
+
+    def is_active(self, url):
+        job = self.get(url)
+        return job is not None and job.is_active()
+
+    def submit(self, url, file_path, civitai_token="", hf_token="", priority=0, group=None, expected_bytes=0):
+        with self._lock:
+            job = self.jobs.get(url)
+            if job is not None and job.is_active():
+                if group is not None and group not in job.groups:
+                    job.groups.append(group)
+                    group.update(job, force=True)
+                return job
+            # Un reintento sigue informando a los grupos de la descarga anterior
+            groups = list(job.groups) if job is not None else []
+            job = DownloadJob(url, file_path, civitai_token, hf_token, priority, next(self._seq))
+            job.groups = groups + [group] if group is not None and group not in groups else groups
+            job.expected_bytes = expected_bytes or 0
+            self.jobs[url] = job
+            job.publish(force=True)
+        self.pump()
+        return job
+
+    def _order_key(self, job):
+        if DOWNLOAD_SETTINGS["queue_order"] == "priority":
+            return (-job.priority, job.seq)
+        return (job.seq,)
+
+    def prune(self):
+        now = time.time()
+        with self._lock:
+            for url, job in list(self.jobs.items()):
+                if not job.is_active() and job.stopped_at and now - job.stopped_at > self.STOPPED_JOB_TTL:
+                    del self.jobs[url]
+
+    def pump(self):
+        self.prune()
+        with self._lock:
+            running = [j for j in self.jobs.values() if j.state == "downloading"]
+            per_host = {}
+            for j in running: per_host[j.host] = per_host.get(j.host, 0) + 1
+            queued = sorted((j for j in self.jobs.values() if j.state == "queued"), key=self._order_key)
+            for job in queued:
+                if len(running) >= max(1, DOWNLOAD_SETTINGS["max_concurrent_downloads"]): break
+                host_limit = DOWNLOAD_SETTINGS["per_host_limits"].get(job.host)
+                if host_limit and per_host.get(job.host, 0) >= host_limit: continue
+                job.state = "downloading"
+                job.publish(force=True)
+                running.append(job)
+                per_host[job.host] = per_host.get(job.host, 0) + 1
+                threading.Thread(target=self._run, args=(job,), daemon=True, name="academia_download").start()
+
+    def _run(self, job):
+        ok = False
+        try:
+            ok = background_download_task(job.url, job.file_path, job.civitai_token, job.hf_token, job=job)
+        finally:
+            with self._lock:
+                if ok or job.stop_reason == "cancel":
+                    job.state = "done" if ok else "cancelled"
+                    self.jobs.pop(job.url, None)
+                elif job.stop_reason == "pause":
+                    job.state, job.stopped_at = "paused", time.time()
+                else:
+                    job.state, job.stopped_at = "error", time.time()
+                job.speed, job.eta = 0.0, None
+                job.publish(force=True)
+            self.pump()
+
+    def cancel(self, url):
+        with self._lock:
+            job = self.jobs.get(url)
+            if job is None: return False
+            job.stop_reason = "cancel"
+            job.stop.set()
+            if job.state != "downloading":
+                self.jobs.pop(url, None)
+                discard_partial(job.file_path + ".temp")
+                job.state = "cancelled"
+                job.publish(force=True)
+        return True
+
+    def pause(self, url):
+        with self._lock:
+            job = self.jobs.get(url)
+            if job is None or not job.is_active(): return False
+            # Sin diario (servidor sin rangos) no hay nada que reanudar: detenerla sería cancelarla
+            if job.state == "downloading" and not os.path.exists(DownloadJournal.path_for(job.file_path + ".temp")):
+                raise ValueError("This download cannot be paused because the server does not support resuming it. Cancel it instead.")
+            job.stop_reason = "pause"
+            job.stop.set()
+            if job.state == "queued":
+                job.state, job.stopped_at = "paused", time.time()
+                job.publish(force=True)
+        return True
+
+    def resume(self, url):
+        with self._lock:
+            job = self.jobs.get(url)
+            if job is None or job.is_active(): return False
+            job.state, job.error, job.stop_reason, job.stopped_at = "queued", None, None, None
+            job.stop = threading.Event()
+            job.publish(force=True)
+        self.pump()
+        return True
+
+    def set_priority(self, url, priority):
+        with self._lock:
+            job = self.jobs.get(url)
+            if job is None: return False
+            job.priority = priority
+        self.pump()
+        return True
+
+    def reserved_bytes(self, device, exclude_url=None):
+        """Disk space still to be claimed by active downloads on the given device."""
+        with self._lock:
+            jobs = [j for j in self.jobs.values() if j.is_active() and j.url != exclude_url]
+        reserved = 0
+        for job in jobs:
+            try:
+                if os.stat(_existing_dir(os.path.dirname(job.file_path))).st_dev != device: continue
+            except OSError:
+                continue
+            reserved += bytes_still_needed(job.file_path, job.total_bytes or job.expected_bytes)
+        return reserved
+
+    def snapshot(self):
+        self.prune()
+        with self._lock:
+            return [j.to_dict() for j in sorted(self.jobs.values(), key=self._order_key)]
+
+DOWNLOAD_QUEUE = DownloadScheduler()
 
 # --- RUTAS API ---
 @PromptServer.instance.routes.get("/academia/tokens")
@@ -171,6 +1434,65 @@ async def get_folders(request):
     raw_folders.sort()
     return web.json_response(raw_folders)
 
+@PromptServer.instance.routes.get("/academia/download_settings")
+async def get_download_settings(request):
+    return web.json_response(DOWNLOAD_SETTINGS)
+
+@PromptServer.instance.routes.post("/academia/download_settings")
+async def save_download_settings(request):
+    data = await request.json()
+    try:
+        for k in DOWNLOAD_SETTINGS:
+            if k in data: DOWNLOAD_SETTINGS[k] = type(DOWNLOAD_SETTINGS[k])(data[k])
+        CONNECTION_LIMITER.set_limit(DOWNLOAD_SETTINGS["max_total_connections"])
+        HTTP.configure()
+        apply_bandwidth_settings()
+        DOWNLOAD_QUEUE.pump()
+        persist_download_settings()
+        return web.json_response({"status": "success", "settings": DOWNLOAD_SETTINGS})
+    except Exception as e: return web.json_response({"status": "error", "message": str(e)})
+
+def apply_bandwidth_settings():
+    BANDWIDTH.configure()
+    with DOWNLOAD_QUEUE._lock:
+        jobs = list(DOWNLOAD_QUEUE.jobs.values())
+    for job in jobs:
+        if job.limit_mb_s is None: job.set_limit(None)
+
+@PromptServer.instance.routes.get("/academia/bandwidth")
+async def get_bandwidth(request):
+    return web.json_response({"status": "success", **BANDWIDTH.stats()})
+
+@PromptServer.instance.routes.post("/academia/bandwidth")
+async def set_bandwidth(request):
+    """Changes the limits at runtime. With "url", sets (or with null clears) that download's own limit."""
+    data = await request.json()
+    try:
+        url = data.get("url", "").strip()
+        if url:
+            job = DOWNLOAD_QUEUE.get(url)
+            if job is None: return web.json_response({"status": "error", "message": "Download not found in queue."})
+            limit = data.get("limit_mb_s")
+            job.set_limit(None if limit is None else max(0.0, float(limit)))
+            job.publish(force=True)
+            return web.json_response({"status": "success", "job": job.to_dict()})
+        for k in ("bandwidth_limit_mb_s", "per_download_limit_mb_s", "pause_while_executing"):
+            if k in data: DOWNLOAD_SETTINGS[k] = type(DOWNLOAD_SETTINGS[k])(data[k])
+        apply_bandwidth_settings()
+        persist_download_settings()
+        return web.json_response({"status": "success", **BANDWIDTH.stats()})
+    except Exception as e: return web.json_response({"status": "error", "message": str(e)})
+
+@PromptServer.instance.routes.post("/academia/rebuild_index")
+async def rebuild_model_index(request):
+    stats = await asyncio.to_thread(MODEL_INDEX.rebuild)
+    stats["hashed_files"] = await asyncio.to_thread(CONTENT_STORE.scan_sidecars)
+    return web.json_response({"status": "success", **stats})
+
+@PromptServer.instance.routes.get("/academia/http_stats")
+async def get_http_stats(request):
+    return web.json_response(HTTP.stats())
+
 @PromptServer.instance.routes.post("/academia/parse_url")
 async def parse_url(request):
     data = await request.json()
@@ -180,59 +1502,82 @@ async def parse_url(request):
         match = re.search(r"huggingface\.co/([^/]+/[^/?#]+)(?:/tree/([^/?#]+))?", url)
         if match:
             repo_id, branch = match.group(1), match.group(2) or "main"
-            headers = HEADERS.copy()
-            if hf_token: headers["Authorization"] = f"Bearer {hf_token}"
             try:
-                res = await asyncio.to_thread(requests.get, f"https://huggingface.co/api/models/{repo_id}", headers=headers, timeout=10)
-                if res.status_code == 200:
-                    files = [{"name": os.path.basename(s["rfilename"]), "url": f"https://huggingface.co/{repo_id}/resolve/{branch}/{s['rfilename']}", "size": format_size(s.get("size"))} 
-                             for s in res.json().get("siblings", []) if s["rfilename"].endswith((".safetensors", ".gguf", ".ckpt", ".pt", ".bin", ".pth", ".onnx", ".sft"))]
-                    if files: return web.json_response({"status": "success", "type": "repo", "files": files})
+                siblings = await asyncio.to_thread(hf_repo_siblings, repo_id, branch, hf_token)
+                files = [{"name": os.path.basename(s["rfilename"]), "url": f"https://huggingface.co/{repo_id}/resolve/{branch}/{s['rfilename']}", "size": format_size(s.get("size")), "sha256": (s.get("lfs") or {}).get("sha256")} 
+                         for s in siblings if s["rfilename"].endswith(MODEL_EXTENSIONS)]
+                if files: return web.json_response({"status": "success", "type": "repo", "files": files})
             except: pass
     return web.json_response({"status": "success", "type": "direct", "url": url})
 
-@PromptServer.instance.routes.post("/academia/check")
-async def check_file(request):
-    data = await request.json()
-    url = data.get("url", "").strip() 
+CHECK_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="academia_check")
+
+def check_row(data, civitai_token="", hf_token=""):
+    """Resolves the status of one downloader row. Blocking: runs inside CHECK_POOL."""
+    url = (data.get("url") or "").strip() 
     folder = data.get("folder")
-    subfolder = data.get("subfolder", "").strip()
-    filename_hint = data.get("filename", "").strip() 
-    civ_t, hf_t = data.get("civitai_token", "").strip(), data.get("hf_token", "").strip()
+    subfolder = (data.get("subfolder") or "").strip()
+    filename_hint = (data.get("filename") or "").strip() 
+    civ_t = (data.get("civitai_token") or civitai_token or "").strip()
+    hf_t = (data.get("hf_token") or hf_token or "").strip()
     
-    if not url or url == "none": return web.json_response({"status": "error", "exists": False})
+    if not url or url == "none": return {"status": "error", "exists": False}
 
-    if url in ACTIVE_DOWNLOADS:
-        return web.json_response({"status": "success", "exists": False, "is_downloading": True, "progress": ACTIVE_DOWNLOADS[url].get("progress", -1)})
+    job = DOWNLOAD_QUEUE.get(url)
+    if job is not None and job.is_active():
+        return {"status": "success", "exists": False, "is_downloading": True, "progress": job.progress, "queue_state": job.state}
 
     filename = os.path.basename(filename_hint) if filename_hint else ""
     filesize = "Unknown"
 
     if not filename or filename in ["Direct Link", "Pending..."]:
-        filename, filesize = await asyncio.to_thread(get_file_info_from_url, url, civ_t, hf_t)
-        if not filename: return web.json_response({"status": "error", "exists": False, "message": "auth_required", "filesize": filesize})
+        filename, filesize = get_file_info_from_url(url, civ_t, hf_t)
+        if not filename: return {"status": "error", "exists": False, "message": "auth_required", "filesize": filesize}
 
-    existing_file = find_existing_file(folder, subfolder, filename)
-    exists = existing_file is not None
+    existing = find_existing_file_info(folder, subfolder, filename)
+    existing_file = existing[0] if existing else None
+    exists = existing is not None
 
     if exists:
-        try: filesize = format_size(os.path.getsize(existing_file))
-        except: pass
-        URL_INFO_CACHE[url] = {"filename": filename, "size": filesize}
+        filesize = format_size(existing[1])
     else:
         # ¡BUGFIX! Forzamos siempre a leer el tamaño si no existe, sin importar si el nombre ya lo sabíamos.
-        real_fname, real_fsize = await asyncio.to_thread(get_file_info_from_url, url, civ_t, hf_t)
+        real_fname, real_fsize = get_file_info_from_url(url, civ_t, hf_t)
         if real_fsize and real_fsize != "Unknown":
             filesize = real_fsize
             
         if real_fname and real_fname != filename:
             filename = os.path.basename(real_fname)
-            exists = find_existing_file(folder, subfolder, filename) is not None
+            existing = find_existing_file_info(folder, subfolder, filename)
+            existing_file = existing[0] if existing else None
+            exists = existing is not None
             if exists:
-                try: filesize = format_size(os.path.getsize(find_existing_file(folder, subfolder, filename)))
-                except: pass
+                filesize = format_size(existing[1])
 
-    return web.json_response({"status": "success", "exists": exists, "filename": filename, "filesize": filesize, "is_downloading": False})
+    resume_progress = None if exists else get_resume_progress(os.path.join(get_download_target_path(folder, subfolder), filename))
+    return {"status": "success", "exists": exists, "filename": filename, "filesize": filesize, "is_downloading": False, "resumable": resume_progress is not None, "progress": resume_progress if resume_progress is not None else -1,
+            "sha256": read_sha256_sidecar(existing_file) if exists else None}
+
+@PromptServer.instance.routes.post("/academia/check")
+async def check_file(request):
+    data = await request.json()
+    result = await asyncio.get_running_loop().run_in_executor(CHECK_POOL, check_row, data)
+    return web.json_response(result)
+
+@PromptServer.instance.routes.post("/academia/check_batch")
+async def check_files_batch(request):
+    """Checks a whole download list in one request; rows are resolved concurrently on CHECK_POOL."""
+    data = await request.json()
+    rows = data.get("rows", [])
+    civ_t, hf_t = data.get("civitai_token", ""), data.get("hf_token", "")
+    loop = asyncio.get_running_loop()
+
+    async def run(row):
+        try: return await loop.run_in_executor(CHECK_POOL, check_row, row, civ_t, hf_t)
+        except Exception as e: return {"status": "error", "exists": False, "message": str(e)}
+
+    results = await asyncio.gather(*(run(row) for row in rows))
+    return web.json_response({"status": "success", "results": results})
 
 @PromptServer.instance.routes.post("/academia/download")
 async def download_file(request):
@@ -243,22 +1588,413 @@ async def download_file(request):
     civ_t, hf_t = data.get("civitai_token", "").strip(), data.get("hf_token", "").strip()
     
     if not url: return web.json_response({"status": "error", "message": "Invalid URL."})
-    if url in ACTIVE_DOWNLOADS: return web.json_response({"status": "started", "message": "Already downloading."})
+    if DOWNLOAD_QUEUE.is_active(url): return web.json_response({"status": "started", "message": "Already downloading."})
 
     filename = os.path.basename(filename) if filename else ""
     if not filename or filename in ["Direct Link", "Pending..."]:
         filename, _ = await asyncio.to_thread(get_file_info_from_url, url, civ_t, hf_t)
         if not filename: return web.json_response({"status": "error", "message": "Auth required or invalid link."})
 
+    try: priority = int(data.get("priority", 0))
+    except (TypeError, ValueError): priority = 0
+    return web.json_response(await asyncio.to_thread(request_download, url, folder, subfolder, filename, civ_t, hf_t, priority))
+
+def request_download(url, folder, subfolder, filename, civitai_token="", hf_token="", priority=0, group=None):
+    """Queues one file unless it is already present, either by name or by content elsewhere on disk. Blocking."""
     if find_existing_file(folder, subfolder, filename):
-        return web.json_response({"status": "exists", "message": "File already exists."})
+        return {"status": "exists", "message": "File already exists."}
 
     file_path = os.path.join(get_download_target_path(folder, subfolder), filename)
-    ACTIVE_DOWNLOADS[url] = {"progress": 0}
-    asyncio.create_task(asyncio.to_thread(background_download_task, url, file_path, civ_t, hf_t))
-    
+    try:
+        source, sha256 = find_duplicate(url, filename, civitai_token, hf_token)
+        if source and os.path.normcase(os.path.abspath(source)) != os.path.normcase(os.path.abspath(file_path)):
+            method = CONTENT_STORE.materialize(source, file_path, sha256)
+            return {"status": "exists", "message": f"Identical file found on disk ({method}).", "deduplicated": method}
+    except Exception as e:
+        print(f"[AcademiaSD] ⚠️ Deduplication skipped for {filename}: {e}")
+
+    # Rechazamos ahora, no tras escribir decenas de GB
+    size_bytes = (get_url_metadata(url, civitai_token, hf_token) or {}).get("size_bytes")
+    no_space = check_disk_space(file_path, size_bytes, exclude_url=url)
+    if no_space: return no_space
+
+    job = DOWNLOAD_QUEUE.submit(url, file_path, civitai_token, hf_token, priority, group, size_bytes)
+    return {"status": "started", "queue_state": job.state}
+
+@PromptServer.instance.routes.get("/academia/dedup_stats")
+async def get_dedup_stats(request):
+    return web.json_response({"status": "success", **CONTENT_STORE.stats()})
+
+@PromptServer.instance.routes.get("/academia/download_queue")
+async def get_download_queue(request):
+    return web.json_response({"status": "success", "jobs": DOWNLOAD_QUEUE.snapshot()})
+
+@PromptServer.instance.routes.post("/academia/download_queue/{action}")
+async def control_download_queue(request):
+    action = request.match_info["action"]
+    data = await request.json()
+    url = data.get("url", "").strip()
+    if action == "cancel": ok = DOWNLOAD_QUEUE.cancel(url)
+    elif action == "pause":
+        try: ok = DOWNLOAD_QUEUE.pause(url)
+        except ValueError as e: return web.json_response({"status": "error", "message": str(e)})
+    elif action == "resume": ok = DOWNLOAD_QUEUE.resume(url)
+    elif action == "priority":
+        try: ok = DOWNLOAD_QUEUE.set_priority(url, int(data.get("priority", 0)))
+        except (TypeError, ValueError): ok = False
+    else: return web.json_response({"status": "error", "message": f"Unknown action '{action}'."})
+    if not ok: return web.json_response({"status": "error", "message": "Download not found in queue."})
+    return web.json_response({"status": "success", "jobs": DOWNLOAD_QUEUE.snapshot()})
+
+# --- CONVERSIÓN A SAFETENSORS ---
+class SafetensorsConverter:
+    """Background worker that rewrites pickle checkpoints (.ckpt/.pt/.bin/.pth) as .safetensors.
+
+    Files are read with ComfyUI's weights_only loader, so no arbitrary pickle code runs. The
+    original -> converted mapping is persisted so lookups treat either name as present, and the
+    load time of both formats is recorded for comparison.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self.pending = set()
+        self.records = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.records = json.load(f)
+            except Exception as e:
+                print(f"[AcademiaSD] ⚠️ Could not read conversions file: {e}")
+        self._by_converted = {os.path.normcase(r["converted"]): k for k, r in self.records.items()}
+
+    def alias_name(self, dir_path, filename):
+        """Name under which filename lives in dir_path after (or before) conversion, if it was converted."""
+        key = os.path.normcase(os.path.join(dir_path, filename))
+        with self._lock:
+            record = self.records.get(key)
+            if record: return os.path.basename(record["converted"])
+            original = self._by_converted.get(key)
+            if original: return os.path.basename(self.records[original]["original"])
+        return None
+
+    def submit(self, file_path):
+        with self._lock:
+            if file_path in self.pending: return False
+            self.pending.add(file_path)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, daemon=True, name="academia_convert")
+                self._thread.start()
+        self._queue.put(file_path)
+        return True
+
+    def _worker(self):
+        while True:
+            file_path = self._queue.get()
+            try:
+                self.convert(file_path)
+            except Exception as e:
+                print(f"[AcademiaSD] ❌ Could not convert {os.path.basename(file_path)} to safetensors: {e}")
+            finally:
+                with self._lock:
+                    self.pending.discard(file_path)
+
+    def save(self):
+        with self._lock:
+            data = dict(self.records)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp, self.path)
+
+    def convert(self, file_path):
+        import torch
+        import comfy.utils
+        from safetensors.torch import save_file
+
+        target = os.path.splitext(file_path)[0] + ".safetensors"
+        if os.path.exists(target):
+            print(f"[AcademiaSD] ⏩ {os.path.basename(target)} already exists, conversion skipped")
+            return None
+        name = os.path.basename(file_path)
+        print(f"[AcademiaSD] 🔄 Converting {name} to safetensors...")
+
+        t0 = time.perf_counter()
+        sd = comfy.utils.load_torch_file(file_path, safe_load=True)
+        load_before = time.perf_counter() - t0
+        if not sd or not all(isinstance(v, torch.Tensor) for v in sd.values()):
+            print(f"[AcademiaSD] ⏩ {name} is not a plain tensor state dict, conversion skipped")
+            return None
+
+        # safetensors no admite tensores que compartan memoria: clonamos solo los que la comparten
+        tensors, seen = {}, set()
+        for k, v in sd.items():
+            v = v.contiguous()
+            storage = v.untyped_storage()
+            if storage.data_ptr() in seen or storage.nbytes() != v.nbytes():
+                v = v.clone()
+            seen.add(v.untyped_storage().data_ptr())
+            tensors[k] = v
+        del sd
+
+        temp_target = target + ".temp"
+        save_file(tensors, temp_target, metadata={"format": "pt", "academia_converted_from": name})
+        count = len(tensors)
+        del tensors
+
+        t0 = time.perf_counter()
+        check = comfy.utils.load_torch_file(temp_target, safe_load=True)
+        load_after = time.perf_counter() - t0
+        if len(check) != count:
+            os.remove(temp_target)
+            raise IOError(f"Converted file has {len(check)} tensors, expected {count}")
+        del check
+        os.replace(temp_target, target)
+
+        record = {"original": file_path, "converted": target, "tensors": count,
+                  "original_bytes": os.path.getsize(file_path), "converted_bytes": os.path.getsize(target),
+                  "load_seconds_before": round(load_before, 3), "load_seconds_after": round(load_after, 3),
+                  "converted_at": time.time(), "original_kept": not DOWNLOAD_SETTINGS["convert_delete_original"]}
+        if DOWNLOAD_SETTINGS["convert_delete_original"]:
+            os.remove(file_path)
+            try: os.remove(sha256_sidecar_path(file_path))
+            except FileNotFoundError: pass
+        with self._lock:
+            self.records[os.path.normcase(file_path)] = record
+            self._by_converted[os.path.normcase(target)] = os.path.normcase(file_path)
+        self.save()
+        MODEL_INDEX.invalidate(os.path.dirname(target))
+        print(f"[AcademiaSD] ✅ {name} -> {os.path.basename(target)} ({count} tensors). Load time: {load_before:.2f}s -> {load_after:.2f}s")
+        return record
+
+CONVERSIONS = SafetensorsConverter(CONVERSIONS_FILE)
+
+@PromptServer.instance.routes.get("/academia/conversions")
+async def get_conversions(request):
+    with CONVERSIONS._lock:
+        records = list(CONVERSIONS.records.values())
+        pending = sorted(CONVERSIONS.pending)
+    return web.json_response({"status": "success", "conversions": records, "pending": pending})
+
+@PromptServer.instance.routes.post("/academia/conversions")
+async def convert_existing_model(request):
+    """Queues the conversion of a model that is already on disk."""
+    data = await request.json()
+    filename = os.path.basename(data.get("filename", ""))
+    if not filename.lower().endswith(PICKLE_EXTENSIONS):
+        return web.json_response({"status": "error", "message": "Only .ckpt, .pt, .bin and .pth files can be converted."})
+    existing = find_existing_file_info(data.get("folder"), data.get("subfolder", ""), filename)
+    if not existing or not existing[0].lower().endswith(PICKLE_EXTENSIONS):
+        return web.json_response({"status": "error", "message": "File not found."})
+    CONVERSIONS.submit(existing[0])
     return web.json_response({"status": "started"})
 
+# --- REQUISITOS DE WORKFLOW Y PRECARGA EN BLOQUE ---
+PREFETCH_EVENT = "academia.prefetch.progress"
+PREFETCH_GROUPS = OrderedDict()
+PREFETCH_FINISHED_TTL = 600  # Segundos que un grupo terminado sigue consultable
+PREFETCH_MAX_GROUPS = 64
+PREFETCH_FINAL_STATES = ("done", "cancelled", "error")
+
+def prune_prefetch_groups():
+    """Drops groups whose files all reached a final state a while ago, and the oldest beyond PREFETCH_MAX_GROUPS."""
+    now = time.time()
+    for gid, group in list(PREFETCH_GROUPS.items()):
+        if group.finished_at and now - group.finished_at > PREFETCH_FINISHED_TTL:
+            del PREFETCH_GROUPS[gid]
+    while len(PREFETCH_GROUPS) > PREFETCH_MAX_GROUPS:
+        PREFETCH_GROUPS.popitem(last=False)
+
+def load_saved_tokens():
+    try:
+        with open(TOKENS_FILE, "r") as f: return json.load(f)
+    except Exception: return {}
+
+def requirements_from_rows(rows):
+    """Downloader rows (node state or academia_presets file) to requirement dicts; disabled rows are skipped."""
+    reqs = []
+    for row in rows or []:
+        if not isinstance(row, dict) or not row.get("enabled", row.get("active", True)): continue
+        url = (row.get("selected_url") or row.get("url") or "").strip()
+        if not url.startswith(("http://", "https://")): continue
+        reqs.append({"url": url, "folder": row.get("folder") or row.get("dir"), "subfolder": (row.get("subfolder") or "").strip(),
+                     "filename": os.path.basename((row.get("filename") or "").replace("\\", "/"))})
+    return reqs
+
+def requirements_from_workflow(workflow):
+    """Collects model requirements from a UI-format workflow: node "models" properties and Academia downloader rows.
+
+    Returns (requirements, unresolved) where unresolved lists model filenames used in widgets without a download URL.
+    """
+    nodes = list(workflow.get("nodes", []))
+    for sg in (workflow.get("definitions") or {}).get("subgraphs", []):
+        nodes.extend(sg.get("nodes", []))
+
+    reqs, referenced = [], set()
+    for node in nodes:
+        for m in (node.get("properties") or {}).get("models") or []:
+            name = (m.get("name") or "").replace("\\", "/")
+            if not m.get("url") or not name: continue
+            reqs.append({"url": m["url"].strip(), "folder": m.get("directory"), "subfolder": os.path.dirname(name), "filename": os.path.basename(name)})
+        if "academia_models" in node:
+            reqs.extend(requirements_from_rows(node["academia_models"]))
+        widgets = node.get("widgets_values")
+        for v in widgets if isinstance(widgets, list) else []:
+            if isinstance(v, str) and v.lower().endswith(MODEL_EXTENSIONS):
+                referenced.add(os.path.basename(v.replace("\\", "/")))
+
+    unique, seen = [], set()
+    for r in reqs:
+        key = (r["folder"], r["subfolder"], r["filename"] or r["url"])
+        if key in seen: continue
+        seen.add(key)
+        unique.append(r)
+    unresolved = sorted(referenced - {r["filename"] for r in unique})
+    return unique, unresolved
+
+def resolve_requirement(req, civitai_token="", hf_token=""):
+    """Existence and size of one requirement. Blocking: runs inside CHECK_POOL."""
+    result = dict(req)
+    if not req["folder"]:
+        result.update(exists=False, size_bytes=None, message="no_folder")
+        return result
+    filename = req["filename"]
+    if not filename or filename in ["Direct Link", "Pending..."]:
+        filename, _ = get_file_info_from_url(req["url"], civitai_token, hf_token)
+    result["filename"] = filename
+    if not filename:
+        result.update(exists=False, auth_required=True, size_bytes=None)
+        return result
+    existing = find_existing_file_info(req["folder"], req["subfolder"], filename)
+    if existing:
+        result.update(exists=True, path=existing[0], size_bytes=existing[1])
+    else:
+        meta = get_url_metadata(req["url"], civitai_token, hf_token) or {}
+        result.update(exists=False, auth_required=bool(meta.get("auth_required")), size_bytes=meta.get("size_bytes"))
+    return result
+
+async def scan_requirements(data):
+    if data.get("preset"):
+        safe_name = "".join(c for c in data["preset"] if c.isalnum() or c in (' ', '-', '_')).rstrip()
+        with open(os.path.join(PRESETS_DIR, f"{safe_name}.json"), "r", encoding="utf-8") as f:
+            reqs, unresolved = requirements_from_rows(json.load(f)), []
+    else:
+        workflow = data.get("workflow") or {}
+        if isinstance(workflow, str): workflow = json.loads(workflow)
+        reqs, unresolved = requirements_from_workflow(workflow)
+
+    saved = load_saved_tokens()
+    civ_t = (data.get("civitai_token") or saved.get("civitai", "")).strip()
+    hf_t = (data.get("hf_token") or saved.get("huggingface", "")).strip()
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(loop.run_in_executor(CHECK_POOL, resolve_requirement, r, civ_t, hf_t) for r in reqs))
+    return results, unresolved, civ_t, hf_t
+
+class PrefetchGroup:
+    """Aggregate progress of the downloads queued for one workflow or preset."""
+    def __init__(self, items):
+        self.id = uuid.uuid4().hex[:12]
+        self.items = {}
+        for r in items:
+            self.items[r["url"]] = {"filename": r["filename"], "state": "done" if r.get("exists") else "queued",
+                                    "total_bytes": r.get("size_bytes") or 0, "done_bytes": (r.get("size_bytes") or 0) if r.get("exists") else 0}
+        self._lock = threading.Lock()
+        self._last_emit = 0.0
+        self.finished_at = None
+        self._check_finished()
+
+    def _check_finished(self):
+        # Un archivo con error puede reanudarse, así que el grupo vuelve a estar activo
+        if all(i["state"] in PREFETCH_FINAL_STATES for i in self.items.values()):
+            self.finished_at = self.finished_at or time.time()
+        else:
+            self.finished_at = None
+
+    def set_state(self, url, state, message=None):
+        with self._lock:
+            item = self.items[url]
+            item["state"] = state
+            if state == "done": item["done_bytes"] = item["total_bytes"]
+            if message: item["message"] = message
+            self._check_finished()
+
+    def update(self, job, force=False):
+        with self._lock:
+            item = self.items.get(job.url)
+            if item is None: return
+            item["state"] = job.state
+            if job.total_bytes: item["total_bytes"] = job.total_bytes
+            item["done_bytes"] = item["total_bytes"] if job.state == "done" else job.done_bytes
+            if job.error: item["message"] = job.error
+            self._check_finished()
+        now = time.time()
+        if force or now - self._last_emit >= PROGRESS_INTERVAL:
+            self._last_emit = now
+            try: PromptServer.instance.send_sync(PREFETCH_EVENT, self.to_dict())
+            except Exception: pass
+
+    def to_dict(self):
+        with self._lock:
+            files = [{"url": u, **i} for u, i in self.items.items()]
+        total = sum(f["total_bytes"] for f in files)
+        done = sum(f["done_bytes"] for f in files)
+        counts = {}
+        for f in files: counts[f["state"]] = counts.get(f["state"], 0) + 1
+        return {"id": self.id, "files": files, "counts": counts, "total_bytes": total, "done_bytes": done,
+                "progress": int(done * 100 / total) if total else (100 if files and counts.get("done") == len(files) else 0)}
+
+@PromptServer.instance.routes.post("/academia/workflow_requirements")
+async def get_workflow_requirements(request):
+    """Lists the model files a workflow (or preset) needs and which of them are already on disk."""
+    data = await request.json()
+    try:
+        results, unresolved, _, _ = await scan_requirements(data)
+    except Exception as e:
+        return web.json_response({"status": "error", "message": str(e)})
+    missing = [r for r in results if not r.get("exists")]
+    return web.json_response({"status": "success", "requirements": results, "missing": len(missing),
+                              "missing_bytes": sum(r.get("size_bytes") or 0 for r in missing), "unresolved": unresolved})
+
+@PromptServer.instance.routes.post("/academia/workflow_prefetch")
+async def prefetch_workflow_models(request):
+    """Scans a workflow (or preset) and queues every missing model as one group with aggregate progress."""
+    data = await request.json()
+    try:
+        results, unresolved, civ_t, hf_t = await scan_requirements(data)
+    except Exception as e:
+        return web.json_response({"status": "error", "message": str(e)})
+    try: priority = int(data.get("priority", 0))
+    except (TypeError, ValueError): priority = 0
+
+    prune_prefetch_groups()
+    group = PrefetchGroup(results)
+    PREFETCH_GROUPS[group.id] = group
+    for r in results:
+        if r.get("exists"): continue
+        if r.get("message") == "no_folder":
+            group.set_state(r["url"], "error", "no_folder")
+            continue
+        if r.get("auth_required"):
+            group.set_state(r["url"], "error", "auth_required")
+            continue
+        res = await asyncio.to_thread(request_download, r["url"], r["folder"], r["subfolder"], r["filename"], civ_t, hf_t, priority, group)
+        if res["status"] == "exists": group.set_state(r["url"], "done")
+        elif res["status"] == "error": group.set_state(r["url"], "error", res.get("message"))
+    summary = group.to_dict()
+    summary["unresolved"] = unresolved
+    return web.json_response({"status": "success", **summary})
+
+@PromptServer.instance.routes.get("/academia/workflow_prefetch")
+async def get_prefetch_status(request):
+    prune_prefetch_groups()
+    gid = request.query.get("id")
+    if gid:
+        group = PREFETCH_GROUPS.get(gid)
+        if group is None: return web.json_response({"status": "error", "message": "Unknown prefetch id."})
+        return web.json_response({"status": "success", **group.to_dict()})
+    return web.json_response({"status": "success", "groups": [g.to_dict() for g in PREFETCH_GROUPS.values()]})
+
 class AcademiaDownloaderNode:
     def __init__(self): pass
     @classmethod
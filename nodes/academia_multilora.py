@@ -1,6 +1,11 @@
 import os
 import json
 import struct
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import comfy.sd
 import comfy.utils
 import folder_paths
@@ -8,68 +13,472 @@ from server import PromptServer
 from aiohttp import web
 import asyncio
 
+# --- AJUSTES DEL MULTI-LORA ---
+MULTILORA_SETTINGS_FILE = os.path.join(folder_paths.base_path, "models", "academia_multilora_settings.json")
+MULTILORA_SETTINGS = {
+    "cache_mb": 2048,  # RAM máxima para LoRAs ya leídos y reutilizables entre ejecuciones (0 = sin caché)
+    "prefetch_workers": 2,  # Hilos que leen los siguientes LoRAs de la pila mientras se aplica el actual (0 = en serie)
+    "prefetch_inflight_mb": 2048,  # Tope de MB leídos por adelantado y aún no aplicados
+}
+
+def load_multilora_settings():
+    if os.path.exists(MULTILORA_SETTINGS_FILE):
+        try:
+            with open(MULTILORA_SETTINGS_FILE, "r") as f:
+                saved = json.load(f)
+            for k in MULTILORA_SETTINGS:
+                if k in saved: MULTILORA_SETTINGS[k] = type(MULTILORA_SETTINGS[k])(saved[k])
+        except Exception as e:
+            print(f"[AcademiaSD] ⚠️ Could not read Multi-LoRA settings: {e}")
+
+load_multilora_settings()
+
+# --- CACHÉ DE LORAS EN RAM ---
+def load_lora_file(lora_path, timings=None):
+    """Loads a LoRA state dict in a single pass over the file.
+
+    For .safetensors the header parse and the tensor reads are timed separately ("parse" / "read");
+    other formats go through comfy.utils.load_torch_file as one "load" step.
+    """
+    t0 = time.perf_counter()
+    if not lora_path.lower().endswith(".safetensors"):
+        sd = comfy.utils.load_torch_file(lora_path, safe_load=True)
+        if timings is not None: timings["load"] = time.perf_counter() - t0
+        return sd
+    from safetensors import safe_open
+    with safe_open(lora_path, framework="pt", device="cpu") as f:
+        keys = list(f.keys())
+        t1 = time.perf_counter()
+        sd = {k: f.get_tensor(k) for k in keys}
+    if timings is not None: timings.update(parse=t1 - t0, read=time.perf_counter() - t1)
+    return sd
+
+def state_dict_bytes(sd):
+    return sum(t.numel() * t.element_size() for t in sd.values() if hasattr(t, "element_size"))
+
+class LoraStateCache:
+    """Process-wide LRU of loaded LoRA state dicts, bounded by MULTILORA_SETTINGS["cache_mb"].
+
+    Entries are keyed by (path, mtime, size), so a LoRA that is overwritten on disk is read
+    again. comfy.sd.load_lora_for_models only reads the dict, so one copy is shared by every
+    model patched with it.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.entries = OrderedDict()  # (path, mtime_ns, size) -> (state_dict, bytes)
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    @staticmethod
+    def key_for(lora_path):
+        st = os.stat(lora_path)
+        return (os.path.normcase(os.path.abspath(lora_path)), st.st_mtime_ns, st.st_size)
+
+    def load(self, lora_path, timings=None):
+        key = self.key_for(lora_path)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                if timings is not None: timings["cached"] = True
+                return entry[0]
+            self.misses += 1
+        sd = load_lora_file(lora_path, timings)
+        self.put(key, sd)
+        return sd
+
+    def get(self, key):
+        """State dict cached under an arbitrary key (e.g. a recompressed stack), or None."""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None: return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, sd):
+        budget = max(0, MULTILORA_SETTINGS["cache_mb"]) * 1024 * 1024
+        size = state_dict_bytes(sd)
+        with self._lock:
+            # Versiones anteriores del mismo archivo ya no se pueden pedir
+            for old in [k for k in self.entries if k[0] == key[0]]:
+                self.bytes -= self.entries.pop(old)[1]
+            if size > budget: return
+            self.entries[key] = (sd, size)
+            self.bytes += size
+            self._evict(budget)
+
+    def _evict(self, budget):
+        while self.bytes > budget and self.entries:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def resize(self):
+        with self._lock:
+            self._evict(max(0, MULTILORA_SETTINGS["cache_mb"]) * 1024 * 1024)
+
+    def flush(self):
+        with self._lock:
+            count = len(self.entries)
+            self.entries.clear()
+            self.bytes = 0
+        return count
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self.entries), "used_mb": round(self.bytes / (1024 * 1024), 1),
+                    "budget_mb": MULTILORA_SETTINGS["cache_mb"], "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                    "files": [os.path.basename(k[0]) for k in self.entries]}
+
+LORA_CACHE = LoraStateCache()
+
+# --- COPIAS EN PRECISIÓN REDUCIDA (FP16 / BF16) ---
+LORA_PRECISION_DIR = os.path.join(folder_paths.base_path, "models", "academia_lora_cache")
+LORA_PRECISIONS = ["Original", "fp16", "bf16"]
+
+class LoraPrecisionCache:
+    """fp16/bf16 copies of fp32 LoRAs, converted lazily on first use and stored in LORA_PRECISION_DIR.
+
+    Copies are named after the SHA-256 of the source file (hashed once per mtime/size), so a renamed
+    or duplicated LoRA reuses the same copy. LoRAs with no fp32 tensors are remembered and used as-is.
+    """
+    def __init__(self, directory):
+        self.dir = directory
+        self.index_path = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+        self._convert_lock = threading.Lock()
+        self.sources = {}  # ruta normalizada -> {"mtime_ns", "size", "sha256"}
+        self.copies = {}   # nombre de la copia -> estadísticas de la conversión
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.sources, self.copies = data.get("sources", {}), data.get("copies", {})
+            except Exception as e:
+                print(f"[AcademiaSD] ⚠️ Could not read LoRA precision cache index: {e}")
+
+    def save(self):
+        with self._lock:
+            data = {"sources": dict(self.sources), "copies": dict(self.copies)}
+        os.makedirs(self.dir, exist_ok=True)
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp, self.index_path)
+
+    def source_hash(self, lora_path):
+        st = os.stat(lora_path)
+        key = os.path.normcase(os.path.abspath(lora_path))
+        with self._lock:
+            known = self.sources.get(key)
+        if known and known["mtime_ns"] == st.st_mtime_ns and known["size"] == st.st_size:
+            return known["sha256"]
+        sha = hashlib.sha256()
+        with open(lora_path, "rb") as f:
+            for block in iter(lambda: f.read(8 * 1024 * 1024), b""):
+                sha.update(block)
+        with self._lock:
+            self.sources[key] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": sha.hexdigest()}
+        return sha.hexdigest()
+
+    def resolve(self, lora_path, precision, timings=None):
+        """Path to load for lora_path at the given precision, converting it first if needed."""
+        if precision not in ("fp16", "bf16"): return lora_path
+        t0 = time.perf_counter()
+        sha = self.source_hash(lora_path)
+        name = f"{sha[:40]}.{precision}.safetensors"
+        target = os.path.join(self.dir, name)
+        with self._lock:
+            info = self.copies.get(name)
+        if info and info.get("no_fp32"): return lora_path
+        if info and os.path.exists(target): return target
+        with self._convert_lock:
+            if os.path.exists(target): return target
+            self.convert(lora_path, sha, precision, target)
+        if timings is not None: timings["convert"] = time.perf_counter() - t0
+        return target if os.path.exists(target) else lora_path
+
+    def convert(self, lora_path, sha, precision, target):
+        import torch
+        from safetensors.torch import save_file
+
+        dtype = torch.float16 if precision == "fp16" else torch.bfloat16
+        name = os.path.basename(target)
+        t0 = time.perf_counter()
+        sd = comfy.utils.load_torch_file(lora_path, safe_load=True)
+        load_before = time.perf_counter() - t0
+
+        out, converted = {}, 0
+        for k, v in sd.items():
+            if v.dtype in (torch.float32, torch.float64):
+                v = v.to(dtype)
+                converted += 1
+            out[k] = v.contiguous()
+        if not converted:
+            with self._lock:
+                self.copies[name] = {"source": os.path.basename(lora_path), "precision": precision, "no_fp32": True}
+            self.save()
+            return
+
+        metadata = {}
+        if lora_path.endswith(".safetensors"):
+            try: metadata = read_safetensors_header(lora_path).get("__metadata__", {})
+            except Exception: pass
+        metadata.update({"format": "pt", "academia_source": os.path.basename(lora_path),
+                         "academia_source_sha256": sha, "academia_precision": precision})
+        os.makedirs(self.dir, exist_ok=True)
+        tmp = target + ".tmp"
+        save_file(out, tmp, metadata=metadata)
+        os.replace(tmp, target)
+        del sd, out
+
+        t0 = time.perf_counter()
+        comfy.utils.load_torch_file(target, safe_load=True)
+        load_after = time.perf_counter() - t0
+        source_bytes, copy_bytes = os.path.getsize(lora_path), os.path.getsize(target)
+        with self._lock:
+            self.copies[name] = {"source": os.path.basename(lora_path), "precision": precision,
+                                 "source_bytes": source_bytes, "bytes": copy_bytes, "tensors_converted": converted,
+                                 "load_seconds_before": round(load_before, 3), "load_seconds_after": round(load_after, 3)}
+        self.save()
+        print(f"[AcademiaSD] 🪶 {os.path.basename(lora_path)} -> {precision} copy: {(source_bytes - copy_bytes) / (1024 * 1024):.1f} MB saved, load {load_before:.2f}s -> {load_after:.2f}s")
+
+    def stats(self):
+        with self._lock:
+            copies = [dict(c, file=n) for n, c in self.copies.items() if not c.get("no_fp32")]
+        existing = [c for c in copies if os.path.exists(os.path.join(self.dir, c["file"]))]
+        before = sum(c["load_seconds_before"] for c in existing)
+        after = sum(c["load_seconds_after"] for c in existing)
+        return {"copies": len(existing), "source_bytes": sum(c["source_bytes"] for c in existing),
+                "bytes": sum(c["bytes"] for c in existing),
+                "bytes_saved": sum(c["source_bytes"] - c["bytes"] for c in existing),
+                "load_seconds_before": round(before, 3), "load_seconds_after": round(after, 3),
+                "load_time_reduction": round(1 - after / before, 3) if before > 0 else 0.0, "files": existing}
+
+    def clear(self):
+        with self._convert_lock:
+            removed = 0
+            if os.path.isdir(self.dir):
+                for f in os.listdir(self.dir):
+                    if f.endswith(".safetensors"):
+                        try:
+                            os.remove(os.path.join(self.dir, f))
+                            removed += 1
+                        except OSError: pass
+            with self._lock:
+                self.copies = {}
+            self.save()
+        return removed
+
+LORA_PRECISION_CACHE = LoraPrecisionCache(LORA_PRECISION_DIR)
+
+def load_stack_entry(lora_path, precision, timings):
+    return LORA_CACHE.load(LORA_PRECISION_CACHE.resolve(lora_path, precision, timings), timings)
+
+# --- LECTURA ANTICIPADA DE LA PILA ---
+LORA_PREFETCH_POOL = None
+
+def configure_prefetch_pool():
+    global LORA_PREFETCH_POOL
+    old, workers = LORA_PREFETCH_POOL, MULTILORA_SETTINGS["prefetch_workers"]
+    LORA_PREFETCH_POOL = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="academia_lora") if workers > 0 else None
+    if old is not None: old.shutdown(wait=False)
+
+configure_prefetch_pool()
+
+def prefetch_stack(stack, precision="Original"):
+    """Yields (entry, state_dict, error, timings) for each stack entry in order.
+
+    Upcoming LoRAs are read and parsed on LORA_PREFETCH_POOL while the caller patches the current
+    one. Files are only started while the bytes read ahead and not yet consumed stay within
+    prefetch_inflight_mb (the next one always starts, however big).
+    """
+    pool = LORA_PREFETCH_POOL
+    budget = max(0, MULTILORA_SETTINGS["prefetch_inflight_mb"]) * 1024 * 1024
+    pending, inflight, upcoming = deque(), 0, deque(stack)
+    while upcoming or pending:
+        while upcoming and (not pending or (pool is not None and inflight + upcoming[0][4] <= budget)):
+            entry, timings = upcoming.popleft(), {}
+            job = pool.submit(load_stack_entry, entry[2], precision, timings) if pool is not None else None
+            pending.append((entry, job, timings))
+            inflight += entry[4]
+        entry, job, timings = pending.popleft()
+        try:
+            sd, error = (job.result() if job is not None else load_stack_entry(entry[2], precision, timings)), None
+        except Exception as e:
+            sd, error = None, e
+        yield entry, sd, error, timings
+        inflight -= entry[4]
+
 # --- NUEVA API: Leer Metadatos del LoRA en milisegundos ---
+def read_safetensors_header(path):
+    """JSON header of a .safetensors file (tensor index + __metadata__), without touching the weights."""
+    with open(path, "rb") as f:
+        # Los primeros 8 bytes de un safetensors indican el tamaño del JSON del header
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        return json.loads(f.read(header_size).decode("utf-8"))
+
+def extract_lora_metadata(metadata):
+    """Base model, resolution, training tags (by frequency) and trigger words from a safetensors __metadata__ dict."""
+    # Modelo Base
+    base_model = metadata.get("ss_sd_model_name", metadata.get("ss_base_model_version", ""))
+    base_version = metadata.get("ss_base_model_version", metadata.get("modelspec.architecture", ""))
+
+    # Extraer Tags / Trigger Words (Kohya / OneTrainer format)
+    tag_freq = metadata.get("ss_tag_frequency", "")
+    tags_dict = {}
+    if tag_freq:
+        try:
+            tf = json.loads(tag_freq)
+            for ds, ds_tags in tf.items():
+                for tag, count in ds_tags.items():
+                    tags_dict[tag] = tags_dict.get(tag, 0) + count
+        except:
+            pass
+    sorted_tags = sorted(tags_dict.items(), key=lambda x: x[1], reverse=True)
+
+    return {
+        "base_model": base_model, "base_model_version": base_version,
+        "resolution": metadata.get("ss_resolution", ""),
+        "tags": [[t, c] for t, c in sorted_tags[:LORA_INDEX_MAX_TAGS]],
+        # Formato alternativo de trigger words (Civitai/ModelSpec)
+        "triggers": metadata.get("modelspec.trigger_words", metadata.get("ss_tag_frequency_0", "")),
+    }
+
+def format_lora_info(entry):
+    if entry.get("error"):
+        return f"Error reading metadata: {entry['error']}"
+    if not entry.get("has_metadata"):
+        return "No training metadata found in this LoRA."
+
+    output = []
+    if entry["base_model"]:
+        output.append(f"🧠 Base Model: {entry['base_model']}")
+    if entry["resolution"]:
+        output.append(f"📐 Resolution: {entry['resolution']}")
+    if entry["triggers"] and not entry["tags"]:
+        output.append(f"\n🏷️ Triggers:\n{entry['triggers']}")
+    # Si extrajimos los tags correctamente, mostrar los Top 15 para no saturar la pantalla
+    if entry["tags"]:
+        output.append("\n🏷️ Top Training Tags:\n" + ", ".join(t for t, c in entry["tags"][:15]))
+
+    if not output:
+        return "Metadata exists, but no tags or model info were found."
+    return "\n".join(output)
+
+def read_lora_entry(lora_path, st):
+    entry = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "has_metadata": False}
+    if not lora_path.endswith(".safetensors"):
+        return entry
+    try:
+        # Leemos solo el JSON del header (esto es instantáneo, no carga los pesos del modelo)
+        metadata = read_safetensors_header(lora_path).get("__metadata__", {})
+        if metadata:
+            entry["has_metadata"] = True
+            entry.update(extract_lora_metadata(metadata))
+    except Exception as e:
+        entry["error"] = str(e)
+    return entry
+
 def read_lora_metadata(lora_path):
     if not lora_path or not os.path.exists(lora_path):
         return "File not found."
     if not lora_path.endswith(".safetensors"):
         return "Metadata reading is only supported for .safetensors files."
+    return format_lora_info(read_lora_entry(lora_path, os.stat(lora_path)))
 
-    try:
-        with open(lora_path, "rb") as f:
-            # Los primeros 8 bytes de un safetensors indican el tamaño del JSON del header
-            header_size = struct.unpack("<Q", f.read(8))[0]
-            # Leemos el JSON (esto es instantáneo, no carga los pesos del modelo)
-            header_json = f.read(header_size).decode("utf-8")
-            header = json.loads(header_json)
-            
-            metadata = header.get("__metadata__", {})
-            if not metadata:
-                return "No training metadata found in this LoRA."
-            
-            output = []
-            
-            # Modelo Base
-            base_model = metadata.get("ss_sd_model_name", metadata.get("ss_base_model_version", ""))
-            if base_model:
-                output.append(f"🧠 Base Model: {base_model}")
-                
-            # Resolución
-            res = metadata.get("ss_resolution", "")
-            if res:
-                output.append(f"📐 Resolution: {res}")
-                
-            # Extraer Tags / Trigger Words (Kohya / OneTrainer format)
-            tag_freq = metadata.get("ss_tag_frequency", "")
-            tags_dict = {}
-            if tag_freq:
-                try:
-                    tf = json.loads(tag_freq)
-                    for ds, ds_tags in tf.items():
-                        for tag, count in ds_tags.items():
-                            tags_dict[tag] = tags_dict.get(tag, 0) + count
-                except:
-                    pass
-            
-            # Formato alternativo de trigger words (Civitai/ModelSpec)
-            alt_triggers = metadata.get("modelspec.trigger_words", metadata.get("ss_tag_frequency_0", ""))
-            if alt_triggers and not tags_dict:
-                output.append(f"\n🏷️ Triggers:\n{alt_triggers}")
-            
-            # Si extrajimos los tags correctamente, mostrar los Top 15
-            if tags_dict:
-                sorted_tags = sorted(tags_dict.items(), key=lambda x: x[1], reverse=True)
-                # Filtramos los top 15 para no saturar la pantalla
-                top_tags = [f"{t}" for t, c in sorted_tags[:15]]
-                output.append("\n🏷️ Top Training Tags:\n" + ", ".join(top_tags))
-            
-            if not output:
-                return "Metadata exists, but no tags or model info were found."
+# --- ÍNDICE PERSISTENTE DE METADATOS DE LORAS ---
+LORA_INDEX_FILE = os.path.join(folder_paths.base_path, "models", "academia_lora_index.json")
+LORA_INDEX_MAX_TAGS = 50
 
-            return "\n".join(output)
+class LoraMetadataIndex:
+    """Header metadata of every LoRA in the loras folder, kept in memory and in LORA_INDEX_FILE.
 
-    except Exception as e:
-        return f"Error reading metadata: {str(e)}"
+    A refresh only stats the files; headers are re-read for new files or when mtime/size changed,
+    so browsing and searching thousands of LoRAs never touches their weights.
+    """
+    REFRESH_INTERVAL = 2.0
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._last_refresh = 0.0
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except Exception as e:
+                print(f"[AcademiaSD] ⚠️ Could not read LoRA index: {e}")
+
+    def _stat(self, name):
+        path = folder_paths.get_full_path("loras", name)
+        try: return path, os.stat(path) if path else None
+        except OSError: return path, None
+
+    def entry(self, name):
+        """Up-to-date entry for one LoRA (re-reads its header only if the file changed), or None."""
+        path, st = self._stat(name)
+        if st is None: return None
+        with self._lock:
+            cached = self.entries.get(name)
+        if cached and cached["mtime_ns"] == st.st_mtime_ns and cached["size"] == st.st_size:
+            return cached
+        entry = read_lora_entry(path, st)
+        with self._lock:
+            self.entries[name] = entry
+        self.save()
+        return entry
+
+    def refresh(self, force=False):
+        with self._refresh_lock:
+            if not force and time.time() - self._last_refresh < self.REFRESH_INTERVAL: return 0
+            names = folder_paths.get_filename_list("loras")
+            with self._lock:
+                current = dict(self.entries)
+            fresh, parsed = {}, 0
+            for name in names:
+                path, st = self._stat(name)
+                if st is None: continue
+                cached = current.get(name)
+                if cached and cached["mtime_ns"] == st.st_mtime_ns and cached["size"] == st.st_size:
+                    fresh[name] = cached
+                else:
+                    fresh[name] = read_lora_entry(path, st)
+                    parsed += 1
+            changed = parsed or len(fresh) != len(current)
+            with self._lock:
+                self.entries = fresh
+            if changed: self.save()
+            self._last_refresh = time.time()
+            return parsed
+
+    def save(self):
+        with self._lock:
+            data = dict(self.entries)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def search(self, base_model="", resolution="", tag=""):
+        base_model, resolution, tag = base_model.lower(), resolution.lower(), tag.lower()
+        with self._lock:
+            items = list(self.entries.items())
+        results = []
+        for name, e in items:
+            if base_model and base_model not in f"{e.get('base_model', '')} {e.get('base_model_version', '')}".lower(): continue
+            if resolution and resolution not in str(e.get("resolution", "")).lower(): continue
+            if tag and not (any(tag in t.lower() for t, _ in e.get("tags", [])) or tag in str(e.get("triggers", "")).lower()): continue
+            results.append({"name": name, **e})
+        return results
+
+LORA_INDEX = LoraMetadataIndex(LORA_INDEX_FILE)
 
 @PromptServer.instance.routes.post("/academia/lora_info")
 async def get_lora_info(request):
@@ -77,20 +486,355 @@ async def get_lora_info(request):
     lora_name = data.get("name")
     if not lora_name or lora_name == "None":
         return web.json_response({"info": "No LoRA selected."})
+    if not lora_name.endswith(".safetensors"):
+        return web.json_response({"info": "Metadata reading is only supported for .safetensors files."})
 
-    lora_path = folder_paths.get_full_path("loras", lora_name)
     # Lo ejecutamos en segundo plano para no bloquear ComfyUI
-    info = await asyncio.to_thread(read_lora_metadata, lora_path)
-    return web.json_response({"info": info})
+    entry = await asyncio.to_thread(LORA_INDEX.entry, lora_name)
+    return web.json_response({"info": format_lora_info(entry) if entry else "File not found."})
+
+@PromptServer.instance.routes.get("/academia/lora_index")
+async def get_lora_index(request):
+    """Every indexed LoRA; with base_model / resolution / tag query parameters, only the matches (substring, case-insensitive)."""
+    await asyncio.to_thread(LORA_INDEX.refresh, request.query.get("refresh") == "1")
+    q = request.query
+    entries = LORA_INDEX.search(q.get("base_model", ""), q.get("resolution", ""), q.get("tag", ""))
+    return web.json_response({"status": "success", "count": len(entries), "loras": entries})
 
 @PromptServer.instance.routes.get("/academia/lora_list")
 async def get_lora_list(request):
     loras = folder_paths.get_filename_list("loras")
     return web.json_response(loras)
 
+@PromptServer.instance.routes.post("/academia/lora_bake")
+async def bake_lora_route(request):
+    """Bakes a lora_data stack (same JSON as the node) into one LoRA file in the loras folder."""
+    data = await request.json()
+    bake_name = data.get("name", "").strip()
+    injection_method = data.get("injection_method", "Standard (Native)")
+    if not bake_name:
+        return web.json_response({"status": "error", "message": "A name for the baked LoRA is required."})
+    lora_data = data.get("lora_data", "[]")
+    stack = parse_lora_stack(lora_data if isinstance(lora_data, str) else json.dumps(lora_data))
+    if not stack:
+        return web.json_response({"status": "error", "message": "No enabled LoRAs to bake."})
+    try:
+        rank, energy = int(data.get("recompress_rank", 0)), float(data.get("recompress_energy", 0.0))
+        summary = await asyncio.to_thread(bake_lora_stack, stack, injection_method, bake_name, rank, energy)
+        return web.json_response({"status": "success", **summary})
+    except Exception as e: return web.json_response({"status": "error", "message": str(e)})
+
+@PromptServer.instance.routes.get("/academia/lora_precision_cache")
+async def get_lora_precision_cache(request):
+    stats = await asyncio.to_thread(LORA_PRECISION_CACHE.stats)
+    return web.json_response({"status": "success", **stats})
+
+@PromptServer.instance.routes.post("/academia/lora_precision_cache/clear")
+async def clear_lora_precision_cache(request):
+    removed = await asyncio.to_thread(LORA_PRECISION_CACHE.clear)
+    return web.json_response({"status": "success", "removed": removed})
+
+@PromptServer.instance.routes.get("/academia/lora_recompress_report")
+async def get_lora_recompress_report(request):
+    """Per-layer ranks, memory and relative error of the last in-node recompression."""
+    return web.json_response({"status": "success", **LAST_RECOMPRESSION})
+
+@PromptServer.instance.routes.get("/academia/multilora_settings")
+async def get_multilora_settings(request):
+    return web.json_response(MULTILORA_SETTINGS)
+
+@PromptServer.instance.routes.post("/academia/multilora_settings")
+async def save_multilora_settings(request):
+    data = await request.json()
+    try:
+        for k in MULTILORA_SETTINGS:
+            if k in data: MULTILORA_SETTINGS[k] = type(MULTILORA_SETTINGS[k])(data[k])
+        LORA_CACHE.resize()
+        configure_prefetch_pool()
+        with open(MULTILORA_SETTINGS_FILE, "w") as f:
+            json.dump(MULTILORA_SETTINGS, f, indent=4)
+        return web.json_response({"status": "success", "settings": MULTILORA_SETTINGS})
+    except Exception as e: return web.json_response({"status": "error", "message": str(e)})
+
+@PromptServer.instance.routes.get("/academia/lora_cache")
+async def get_lora_cache_stats(request):
+    return web.json_response(LORA_CACHE.stats())
+
+@PromptServer.instance.routes.post("/academia/lora_cache/flush")
+async def flush_lora_cache(request):
+    flushed = LORA_CACHE.flush()
+    return web.json_response({"status": "success", "flushed": flushed, **LORA_CACHE.stats()})
+
+# --- PILA DE LORAS NORMALIZADA ---
+def parse_lora_stack(lora_data, verbose=False):
+    """Enabled LoRAs of lora_data that can actually be applied, as (name, strength, path, mtime_ns, size) tuples."""
+    try:
+        loras = json.loads(lora_data)
+    except:
+        loras = []
+    if not isinstance(loras, list): return []
+
+    stack = []
+    for lora in loras:
+        if not isinstance(lora, dict) or not lora.get("enabled", True):
+            continue
+
+        lora_name = lora.get("name")
+        if not lora_name or lora_name == "None":
+            continue
+
+        try: strength = float(lora.get("strength", 1.0))
+        except (TypeError, ValueError): continue
+        if strength == 0.0:
+            if verbose: print(f"[AcademiaSD] ⏩ Skipping: {lora_name} (Strength is 0)")
+            continue
+
+        lora_path = folder_paths.get_full_path("loras", lora_name)
+        try:
+            st = os.stat(lora_path) if lora_path else None
+        except OSError:
+            st = None
+        if st is None:
+            if verbose: print(f"[AcademiaSD] ❌ Warning: Could not find LoRA file: {lora_name}")
+            continue
+        stack.append((lora_name, strength, lora_path, st.st_mtime_ns, st.st_size))
+    return stack
+
+def stack_hash(stack, injection_method):
+    """Content-aware key of a stack: names, strengths, method and the files' mtime/size."""
+    key = [injection_method] + [[name, strength, mtime, size] for name, strength, _, mtime, size in stack]
+    return hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+
+# --- FUSIÓN ("BAKE") DE LA PILA EN UN SOLO LORA ---
+LORA_UP_DOWN = ((".lora_up.weight", ".lora_down.weight"), (".lora_B.weight", ".lora_A.weight"), (".lora.up.weight", ".lora.down.weight"))
+DIFF_SUFFIXES = (".diff", ".diff_b")
+TEXT_ENCODER_PREFIXES = ("lora_te", "text_encoder", "te1.", "te2.", "lora_clip")
+BASE_MODEL_METADATA = ("ss_base_model_version", "ss_sd_model_name", "modelspec.architecture", "ss_resolution")
+
+def split_lora_layers(sd):
+    """Groups a LoRA state dict by layer prefix.
+
+    Returns ({prefix: {"up", "down", "alpha", "style"} and/or {"diff": {suffix: tensor}}}, unsupported_keys).
+    LoHa/LoKr/DoRA/Tucker tensors cannot be folded by concatenation and end up in unsupported_keys.
+    """
+    layers, used = {}, set()
+    for k, v in sd.items():
+        for up_s, down_s in LORA_UP_DOWN:
+            if k.endswith(up_s):
+                prefix = k[:-len(up_s)]
+                down = sd.get(prefix + down_s)
+                if down is None: break
+                layer = layers.setdefault(prefix, {})
+                layer.update(up=v, down=down, style=(up_s, down_s))
+                used.update((k, prefix + down_s))
+                alpha = sd.get(prefix + ".alpha")
+                if alpha is not None:
+                    layer["alpha"] = float(alpha)
+                    used.add(prefix + ".alpha")
+                break
+        else:
+            for suffix in DIFF_SUFFIXES:
+                if k.endswith(suffix):
+                    layers.setdefault(k[:-len(suffix)], {}).setdefault("diff", {})[suffix] = v
+                    used.add(k)
+                    break
+    return layers, [k for k in sd if k not in used]
+
+def baked_lora_path(bake_name):
+    name = os.path.basename(bake_name.strip())
+    if not name.lower().endswith(".safetensors"): name += ".safetensors"
+    return os.path.join(folder_paths.get_folder_paths("loras")[0], name)
+
+def fuse_lora_stack(stack, injection_method):
+    """Collects the stack layer by layer: ({prefix: {"ups", "downs", "diff", "style", "dtype"}}, sources, metadata).
+
+    Strengths (and each file's alpha/rank scale) are folded into the up matrices, kept in fp32.
+    Full-weight diffs are added. Text encoder layers are left out for "Model Only".
+    """
+    include_clip = injection_method == "Standard (Native)"
+    fused, sources, metadata = {}, [], {}
+    for lora_name, strength, lora_path, _, size in stack:
+        layers, unsupported = split_lora_layers(LORA_CACHE.load(lora_path))
+        if unsupported:
+            raise ValueError(f"{lora_name} uses tensors that cannot be baked (LoHa/LoKr/DoRA?): {', '.join(unsupported[:5])}")
+        for prefix, layer in layers.items():
+            if not include_clip and prefix.startswith(TEXT_ENCODER_PREFIXES): continue
+            out = fused.setdefault(prefix, {"ups": [], "downs": [], "diff": {}})
+            if "up" in layer:
+                up, down = layer["up"], layer["down"]
+                if out["downs"] and (down.shape[1:] != out["downs"][0].shape[1:] or up.shape[0] != out["ups"][0].shape[0]):
+                    raise ValueError(f"{lora_name}: layer {prefix} has a shape that does not match the other LoRAs")
+                rank = down.shape[0]
+                scale = strength * (layer["alpha"] / rank if "alpha" in layer else 1.0)
+                out.setdefault("style", layer["style"])
+                out.setdefault("dtype", up.dtype)
+                out["ups"].append(up.float() * scale)
+                out["downs"].append(down.float())
+            for suffix, t in layer.get("diff", {}).items():
+                out.setdefault("dtype", t.dtype)
+                prev = out["diff"].get(suffix)
+                out["diff"][suffix] = t.float() * strength if prev is None else prev + t.float() * strength
+        sources.append({"name": lora_name, "strength": strength, "size": size})
+        try:
+            src_meta = read_safetensors_header(lora_path).get("__metadata__", {}) if lora_path.endswith(".safetensors") else {}
+        except Exception:
+            src_meta = {}
+        for k in BASE_MODEL_METADATA:
+            if k in src_meta and k not in metadata: metadata[k] = src_meta[k]
+    return fused, sources, metadata
+
+def recompress_layer(up, down, rank=0, energy=0.0):
+    """Truncated SVD of the layer delta up @ down, computed from the factors without building the full matrix.
+
+    Keeps the smallest number of singular values reaching `energy` (fraction of the squared
+    Frobenius norm) and/or at most `rank` of them. Returns (up, down, relative_error), or None
+    when the layer cannot be refactored (up matrices with a spatial kernel).
+    """
+    import torch
+
+    if up.dim() > 2 and any(d != 1 for d in up.shape[2:]): return None
+    up2, down2 = up.reshape(up.shape[0], up.shape[1]), down.reshape(down.shape[0], -1)
+    qu, ru = torch.linalg.qr(up2)
+    qd, rd = torch.linalg.qr(down2.T)
+    u, sv, vh = torch.linalg.svd(ru @ rd.T, full_matrices=False)
+    power = sv ** 2
+    total = float(power.sum())
+    k = len(sv)
+    if energy > 0 and total > 0:
+        k = int(torch.searchsorted(torch.cumsum(power, 0) / total, torch.tensor(min(energy, 1.0))).item()) + 1
+    if rank > 0: k = min(k, rank)
+    k = max(1, min(k, len(sv)))
+    error = (float(power[k:].sum()) / total) ** 0.5 if total > 0 else 0.0
+    root = sv[:k].sqrt()
+    new_up = (qu @ u[:, :k]) * root
+    new_down = root[:, None] * (vh[:k] @ qd.T)
+    return new_up.reshape(up.shape[0], k, *up.shape[2:]), new_down.reshape(k, *down.shape[1:]), error
+
+def fused_state_dict(fused, rank=0, energy=0.0, report=None):
+    """LoRA state dict with one up/down pair (or diff) per layer; with rank/energy the pairs are SVD-truncated.
+
+    Without recompression, overlapping layers are concatenated along the rank axis, which sums
+    them exactly (the rank is the sum of the source ranks). Every pair gets alpha == rank.
+    If `report` is a list, one dict per recompressed layer is appended (ranks, bytes, error).
+    """
+    import torch
+
+    out_sd = {}
+    for prefix, layer in fused.items():
+        dtype = layer.get("dtype", torch.float16)
+        if layer["ups"]:
+            up_s, down_s = layer["style"]
+            up, down = torch.cat(layer["ups"], dim=1), torch.cat(layer["downs"], dim=0)
+            if rank > 0 or energy > 0:
+                item = torch.finfo(dtype).bits // 8
+                source_rank, source_bytes = down.shape[0], (up.numel() + down.numel()) * item
+                result = recompress_layer(up, down, rank, energy)
+                if result is not None and result[0].shape[1] < source_rank:
+                    up, down, error = result
+                else:
+                    error = 0.0
+                if report is not None:
+                    report.append({"layer": prefix, "sources": len(layer["ups"]), "rank_before": source_rank,
+                                   "rank_after": down.shape[0], "bytes_before": source_bytes,
+                                   "bytes_after": (up.numel() + down.numel()) * item,
+                                   "relative_error": round(error, 6)})
+            out_sd[prefix + up_s] = up.to(dtype).contiguous()
+            out_sd[prefix + down_s] = down.to(dtype).contiguous()
+            out_sd[prefix + ".alpha"] = torch.tensor(float(down.shape[0]))
+        for suffix, t in layer["diff"].items():
+            out_sd[prefix + suffix] = t.to(dtype).contiguous()
+    return out_sd
+
+def summarize_recompression(report):
+    before = sum(r["bytes_before"] for r in report)
+    after = sum(r["bytes_after"] for r in report)
+    worst = sorted(report, key=lambda r: r["relative_error"], reverse=True)
+    return {"layers": len(report), "bytes_before": before, "bytes_after": after,
+            "max_relative_error": worst[0]["relative_error"] if worst else 0.0,
+            "mean_relative_error": round(sum(r["relative_error"] for r in report) / len(report), 6) if report else 0.0,
+            "worst_layers": worst[:5]}
+
+def log_recompression(summary):
+    mb = 1024 * 1024
+    print(f"[AcademiaSD] 🗜️ Recompressed {summary['layers']} layers: {summary['bytes_before'] / mb:.1f} MB -> {summary['bytes_after'] / mb:.1f} MB, "
+          f"error mean {summary['mean_relative_error']:.4f} / max {summary['max_relative_error']:.4f}")
+    for r in summary["worst_layers"]:
+        print(f"[AcademiaSD]    {r['layer']}: rank {r['rank_before']} -> {r['rank_after']}, error {r['relative_error']:.4f}")
+
+# Informe por capa de la última recompresión (GET /academia/lora_recompress_report)
+LAST_RECOMPRESSION = {}
+
+def recompressed_stack(stack, injection_method, rank=0, energy=0.0):
+    """Single state dict for the whole stack, recompressed per layer; cached in LORA_CACHE under the stack key."""
+    key = (f"recompressed:{stack_hash(stack, injection_method)}:{rank}:{energy}", 0, 0)
+    sd = LORA_CACHE.get(key)
+    if sd is not None: return sd
+    fused, sources, _ = fuse_lora_stack(stack, injection_method)
+    report = []
+    sd = fused_state_dict(fused, rank, energy, report)
+    if not sd: raise ValueError("Nothing to apply: the enabled LoRAs have no applicable tensors.")
+    summary = summarize_recompression(report)
+    log_recompression(summary)
+    LAST_RECOMPRESSION.clear()
+    LAST_RECOMPRESSION.update({"sources": sources, "rank": rank, "energy": energy, **summary, "per_layer": report})
+    LORA_CACHE.put(key, sd)
+    return sd
+
+def bake_key(stack, injection_method, rank=0, energy=0.0):
+    key = stack_hash(stack, injection_method)
+    return key if not (rank > 0 or energy > 0) else f"{key}:{rank}:{energy}"
+
+def bake_lora_stack(stack, injection_method, bake_name, rank=0, energy=0.0):
+    """Fuses the stack into one .safetensors LoRA in the loras folder and returns a summary dict.
+
+    Layers touched by several LoRAs become a single pair (see fused_state_dict), optionally
+    SVD-recompressed to `rank` / `energy`.
+    """
+    from safetensors.torch import save_file
+
+    target = baked_lora_path(bake_name)
+    if os.path.exists(target):
+        try: baked_before = "academia_baked_from" in read_safetensors_header(target).get("__metadata__", {})
+        except Exception: baked_before = False
+        if not baked_before:
+            raise ValueError(f"{os.path.basename(target)} already exists and is not a baked stack; choose another name.")
+    if any(os.path.normcase(path) == os.path.normcase(target) for _, _, path, _, _ in stack):
+        raise ValueError("The baked file cannot overwrite one of its own sources.")
+
+    fused, sources, metadata = fuse_lora_stack(stack, injection_method)
+    report = [] if (rank > 0 or energy > 0) else None
+    out_sd = fused_state_dict(fused, rank, energy, report)
+    if not out_sd: raise ValueError("Nothing to bake: the enabled LoRAs have no applicable tensors.")
+    overlapping = sum(len(layer["ups"]) > 1 for layer in fused.values())
+    max_rank = max((t.shape[0] for k, t in out_sd.items() if k.endswith((".lora_down.weight", ".lora_A.weight", ".lora.down.weight"))), default=0)
+
+    metadata.update({"format": "pt", "ss_network_module": "networks.lora",
+                     "academia_baked_from": json.dumps(sources),
+                     "academia_injection_method": injection_method,
+                     "academia_stack_hash": bake_key(stack, injection_method, rank, energy)})
+    tmp = target + ".tmp"
+    save_file(out_sd, tmp, metadata=metadata)
+    os.replace(tmp, target)
+    LORA_CACHE.put(LORA_CACHE.key_for(target), out_sd)
+    summary = {"file": os.path.basename(target), "sources": sources, "layers": len(fused),
+               "overlapping_layers": overlapping, "max_rank": max_rank, "size_bytes": os.path.getsize(target)}
+    print(f"[AcademiaSD] 🔥 Baked {len(sources)} LoRAs into {summary['file']} ({len(fused)} layers, {overlapping} fused, max rank {max_rank})")
+    if report is not None:
+        summary["recompression"] = summarize_recompression(report)
+        log_recompression(summary["recompression"])
+    return summary
+
+def baked_stack_is_current(target, stack, injection_method, rank=0, energy=0.0):
+    try:
+        meta = read_safetensors_header(target).get("__metadata__", {})
+    except Exception:
+        return False
+    return meta.get("academia_stack_hash") == bake_key(stack, injection_method, rank, energy)
+
 class AcademiaMultiLoraNode:
     def __init__(self):
-        pass
+        # (clave de la pila, model de entrada, clip de entrada, resultado) de la última ejecución
+        self._memo = None
 
     @classmethod
     def INPUT_TYPES(s):
@@ -102,6 +846,13 @@ class AcademiaMultiLoraNode:
             },
             "optional": {
                 "clip": ("CLIP", {"default": None}),
+                # Si se indica un nombre, la pila se fusiona en loras/<nombre>.safetensors y se aplica ese único archivo
+                "bake_name": ("STRING", {"default": ""}),
+                # fp16/bf16: usa (y crea la primera vez) una copia en precisión reducida de los LoRAs fp32
+                "lora_precision": (LORA_PRECISIONS, {"default": "Original"}),
+                # Recompresión SVD: una sola pareja up/down por capa con este rango máximo y/o esta energía (0 = desactivado)
+                "recompress_rank": ("INT", {"default": 0, "min": 0, "max": 1024}),
+                "recompress_energy": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 1.0, "step": 0.001}),
             }
         }
 
@@ -110,43 +861,55 @@ class AcademiaMultiLoraNode:
     FUNCTION = "apply_loras"
     CATEGORY = "Academia SD"
 
-    def apply_loras(self, model, injection_method, lora_data="[]", clip=None):
-        try:
-            loras = json.loads(lora_data)
-        except:
-            loras = []
+    @classmethod
+    def IS_CHANGED(s, injection_method, lora_data="[]", **kwargs):
+        # Cambia si cambia la pila efectiva o si algún LoRA se sobrescribe en disco
+        return stack_hash(parse_lora_stack(lora_data), injection_method)
 
-        if not loras:
+    def apply_loras(self, model, injection_method, lora_data="[]", clip=None, bake_name="", lora_precision="Original",
+                    recompress_rank=0, recompress_energy=0.0):
+        stack = parse_lora_stack(lora_data, verbose=True)
+        if not stack:
             return (model, clip)
 
-        print(f"[AcademiaSD] Starting Multi-LoRA Injection...")
+        recompress = recompress_rank > 0 or recompress_energy > 0
+        key = (bake_key(stack, injection_method, recompress_rank, recompress_energy)
+               + (f"|bake:{bake_name.strip()}" if bake_name.strip() else "") + f"|{lora_precision}")
+        memo = self._memo
+        if memo is not None and memo[0] == key and memo[1] is model and memo[2] is clip:
+            print("[AcademiaSD] ♻️ Multi-LoRA stack unchanged, reusing the patched model")
+            return memo[3]
+        model_in, clip_in = model, clip
 
-        for lora in loras:
-            if not lora.get("enabled", True):
-                continue
-
-            lora_name = lora.get("name")
-            if not lora_name or lora_name == "None":
-                continue
-
-            strength = float(lora.get("strength", 1.0))
-            if strength == 0.0:
-                print(f"[AcademiaSD] ⏩ Skipping: {lora_name} (Strength is 0)")
-                continue
+        loads = None
+        if bake_name.strip() and (len(stack) > 1 or recompress):
+            target = baked_lora_path(bake_name)
+            try:
+                if not baked_stack_is_current(target, stack, injection_method, recompress_rank, recompress_energy):
+                    bake_lora_stack(stack, injection_method, bake_name, recompress_rank, recompress_energy)
+                st = os.stat(target)
+                stack = [(os.path.basename(target), 1.0, target, st.st_mtime_ns, st.st_size)]
+            except Exception as e:
+                print(f"[AcademiaSD] ❌ Could not bake the LoRA stack, applying the LoRAs one by one: {e}")
+        elif recompress:
+            try:
+                t0 = time.perf_counter()
+                sd = recompressed_stack(stack, injection_method, recompress_rank, recompress_energy)
+                loads = [((f"{len(stack)} LoRAs (recompressed)", 1.0, None, 0, 0), sd, None, {"recompress": time.perf_counter() - t0})]
+            except Exception as e:
+                print(f"[AcademiaSD] ❌ Could not recompress the LoRA stack, applying the LoRAs one by one: {e}")
 
-            lora_path = folder_paths.get_full_path("loras", lora_name)
-            if not lora_path:
-                print(f"[AcademiaSD] ❌ Warning: Could not find LoRA file: {lora_name}")
-                continue
+        print(f"[AcademiaSD] Starting Multi-LoRA Injection...")
+        started = time.perf_counter()
 
+        for (lora_name, strength, lora_path, _, _), lora_tensor, error, timings in loads or prefetch_stack(stack, lora_precision):
             print(f"[AcademiaSD] 💉 Injecting: {lora_name} (Strength: {strength})")
             
-            try:
-                lora_tensor = comfy.utils.load_torch_file(lora_path, safe_load=True)
-            except Exception as e:
-                print(f"[AcademiaSD] ❌ Error loading LoRA data for {lora_name}: {e}")
+            if error is not None:
+                print(f"[AcademiaSD] ❌ Error loading LoRA data for {lora_name}: {error}")
                 continue
             
+            patch_start = time.perf_counter()
             strength_model = strength
             strength_clip = strength if (injection_method == "Standard (Native)" and clip is not None) else 0.0
             
@@ -158,7 +921,20 @@ class AcademiaMultiLoraNode:
                 model = lora_model
             if lora_clip is not None and clip is not None:
                 clip = lora_clip
+            patch_time = time.perf_counter() - patch_start
+            if "convert" in timings:
+                print(f"[AcademiaSD] 🪶 {lora_name}: {lora_precision} copy ready in {timings['convert']:.2f}s")
+            if "recompress" in timings:
+                print(f"[AcademiaSD] ⏱️ {lora_name}: fuse + SVD {timings['recompress']:.2f}s, patch {patch_time:.2f}s")
+            elif timings.get("cached"):
+                print(f"[AcademiaSD] ⏱️ {lora_name}: from RAM cache, patch {patch_time:.2f}s")
+            elif "load" in timings:
+                print(f"[AcademiaSD] ⏱️ {lora_name}: load {timings['load']:.2f}s, patch {patch_time:.2f}s")
+            else:
+                print(f"[AcademiaSD] ⏱️ {lora_name}: read {timings.get('read', 0):.2f}s, parse {timings.get('parse', 0):.2f}s, patch {patch_time:.2f}s")
 
+        print(f"[AcademiaSD] ⏱️ Multi-LoRA stack applied in {time.perf_counter() - started:.2f}s")
+        self._memo = (key, model_in, clip_in, (model, clip))
         return (model, clip)
 
 NODE_CLASS_MAPPINGS = {
@@ -5,6 +5,13 @@ import sys
 import os
 import json
 import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import time
+import random
+import re
+from collections import OrderedDict
 from server import PromptServer
 from aiohttp import web
 import folder_paths
@@ -17,7 +24,196 @@ try:
 except ImportError:
     HAS_GENAI = False
 
+# Errores de red transitorios (httpx es dependencia de google-genai)
+try:
+    import httpx
+    TRANSIENT_ERRORS = (ConnectionError, TimeoutError, httpx.TransportError)
+except ImportError:
+    TRANSIENT_ERRORS = (ConnectionError, TimeoutError)
+
 TOKENS_FILE = os.path.join(folder_paths.base_path, "models", "academia_tokens.json")
+GEMINI_API_VERSION = "v1beta"
+
+def load_saved_gemini_key():
+    try:
+        if os.path.exists(TOKENS_FILE):
+            with open(TOKENS_FILE, "r") as f:
+                return json.load(f).get("gemini", "")
+    except: pass
+    return ""
+
+# --- POOL DE CLIENTES DE GEMINI ---
+class GeminiClientPool:
+    """genai.Client instances shared across executions, keyed by (api_key, api_version).
+
+    Creating a client per call repeats its setup and throws away its keep-alive connections.
+    When the key saved in academia_tokens.json changes, the client of the previous key is dropped.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clients = {}
+        self.created = self.reused = self.dropped = 0
+        self._tokens_mtime = None
+        self._saved_key = None
+
+    def _check_saved_key(self):
+        try: mtime = os.stat(TOKENS_FILE).st_mtime_ns
+        except OSError: mtime = None
+        if mtime == self._tokens_mtime: return
+        self._tokens_mtime = mtime
+        saved_key = load_saved_gemini_key().strip()
+        if self._saved_key and saved_key != self._saved_key:
+            self._drop_key(self._saved_key)
+        self._saved_key = saved_key
+
+    def _drop_key(self, api_key):
+        for key in [k for k in self.clients if k[0] == api_key]:
+            del self.clients[key]
+            self.dropped += 1
+
+    def get(self, api_key, api_version=GEMINI_API_VERSION):
+        api_key = api_key.strip()
+        with self._lock:
+            self._check_saved_key()
+            client = self.clients.get((api_key, api_version))
+            if client is not None:
+                self.reused += 1
+                return client
+            client = genai.Client(api_key=api_key, http_options={'api_version': api_version})
+            self.clients[(api_key, api_version)] = client
+            self.created += 1
+            return client
+
+    def drop(self, api_key):
+        with self._lock:
+            self._drop_key(api_key.strip())
+
+    def stats(self):
+        with self._lock:
+            return {"clients": len(self.clients), "created": self.created, "reused": self.reused, "dropped": self.dropped}
+
+GEMINI_CLIENTS = GeminiClientPool()
+
+# --- AJUSTES DE GEMINI ---
+GEMINI_SETTINGS_FILE = os.path.join(folder_paths.base_path, "models", "academia_gemini_settings.json")
+GEMINI_SETTINGS = {
+    "cache_mb": 256,  # Tamaño máximo en disco de la caché de respuestas (0 = sin caché)
+    # Peticiones y tokens (de entrada) por minuto para cada modelo; "default" para el resto (0 = sin límite)
+    "rate_limits": {"default": {"rpm": 0, "tpm": 0}},
+    "max_retries": 5,          # Reintentos ante 429 / 5xx / errores de red
+    "backoff_base": 2.0,       # Segundos del primer reintento; se duplica en cada intento (con jitter)
+    "backoff_max": 60.0,
+    "max_retry_wait": 180.0,   # Tiempo total máximo esperando reintentos para una misma petición
+}
+
+def load_gemini_settings():
+    if os.path.exists(GEMINI_SETTINGS_FILE):
+        try:
+            with open(GEMINI_SETTINGS_FILE, "r") as f:
+                saved = json.load(f)
+            for k in GEMINI_SETTINGS:
+                if k in saved: GEMINI_SETTINGS[k] = type(GEMINI_SETTINGS[k])(saved[k])
+        except Exception as e:
+            print(f"[AcademiaSD] ⚠️ Could not read Gemini settings: {e}")
+
+load_gemini_settings()
+
+# --- CACHÉ DE RESPUESTAS EN DISCO ---
+class GeminiResponseCache:
+    """Content-addressed Gemini responses on disk, evicted least-recently-used beyond GEMINI_SETTINGS["cache_mb"].
+
+    The key hashes exactly what would be sent: the image pixels, the final text, the model and
+    the GenerateContentConfig fields, so only identical requests are answered from disk.
+    """
+    def __init__(self, directory):
+        self.dir = directory
+        self._lock = threading.Lock()
+        self.entries = OrderedDict()  # clave -> bytes en disco, del menos al más reciente
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        if os.path.isdir(directory):
+            files = []
+            for f in os.listdir(directory):
+                if f.endswith(".json"):
+                    try: st = os.stat(os.path.join(directory, f))
+                    except OSError: continue
+                    files.append((st.st_mtime, f[:-5], st.st_size))
+            for _, key, size in sorted(files):
+                self.entries[key] = size
+                self.bytes += size
+
+    @staticmethod
+    def make_key(pixels, final_text, model, config_args):
+        sha = hashlib.sha256()
+        for arr in pixels:
+            sha.update(f"{arr.shape}|{arr.dtype}".encode("utf-8"))
+            sha.update(arr.tobytes())
+        sha.update(json.dumps({"text": final_text, "model": model, "config": config_args}, sort_keys=True).encode("utf-8"))
+        return sha.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.dir, key + ".json")
+
+    def get(self, key):
+        with self._lock:
+            known = key in self.entries
+        if known:
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    text = json.load(f)["text"]
+                os.utime(self._path(key))  # el mtime guarda el orden LRU entre reinicios
+                with self._lock:
+                    if key in self.entries: self.entries.move_to_end(key)
+                    self.hits += 1
+                return text
+            except Exception:
+                with self._lock:
+                    self.bytes -= self.entries.pop(key, 0)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, text, model):
+        budget = max(0, GEMINI_SETTINGS["cache_mb"]) * 1024 * 1024
+        if budget <= 0: return
+        os.makedirs(self.dir, exist_ok=True)
+        path = self._path(key)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"text": text, "model": model, "created": time.time()}, f)
+        os.replace(tmp, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self.bytes += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+            self._evict(budget)
+
+    def _evict(self, budget):
+        while self.bytes > budget and self.entries:
+            key, size = self.entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+            try: os.remove(self._path(key))
+            except OSError: pass
+
+    def clear(self):
+        with self._lock:
+            keys = list(self.entries)
+            self.entries.clear()
+            self.bytes = 0
+        for key in keys:
+            try: os.remove(self._path(key))
+            except OSError: pass
+        return len(keys)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self.entries), "used_mb": round(self.bytes / (1024 * 1024), 2),
+                    "budget_mb": GEMINI_SETTINGS["cache_mb"], "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}
+
+GEMINI_CACHE = GeminiResponseCache(os.path.join(folder_paths.base_path, "models", "academia_gemini_cache"))
 
 # --- RUTAS API PARA GUARDAR Y LEER EL TOKEN DE FORMA SEGURA ---
 @PromptServer.instance.routes.get("/academia/gemini_token")
@@ -39,9 +235,11 @@ async def save_gemini_token(request):
         if os.path.exists(TOKENS_FILE):
             with open(TOKENS_FILE, "r") as f:
                 tokens = json.load(f)
+        old_token = tokens.get("gemini", "")
         tokens["gemini"] = token
         with open(TOKENS_FILE, "w") as f:
             json.dump(tokens, f)
+        if old_token and old_token != token: GEMINI_CLIENTS.drop(old_token)
         return web.json_response({"status": "success"})
     except Exception as e:
         return web.json_response({"status": "error", "message": str(e)})
@@ -54,12 +252,7 @@ async def fetch_gemini_models(request):
     
     # Si la clave está oculta (****) o vacía, la intentamos leer del disco duro
     if not api_key or api_key == "****":
-        try:
-            if os.path.exists(TOKENS_FILE):
-                with open(TOKENS_FILE, "r") as f:
-                    tdata = json.load(f)
-                    api_key = tdata.get("gemini", "")
-        except: pass
+        api_key = load_saved_gemini_key()
 
     if not api_key or api_key == "****":
         return web.json_response({"error": "No API Key provided. Please paste your API Key or save it first."})
@@ -68,7 +261,7 @@ async def fetch_gemini_models(request):
         
     try:
         def get_models():
-            client = genai.Client(api_key=api_key, http_options={'api_version': 'v1beta'})
+            client = GEMINI_CLIENTS.get(api_key)
             models_list = []
             for m in client.models.list():
                 name = m.name
@@ -82,6 +275,170 @@ async def fetch_gemini_models(request):
     except Exception as e:
         return web.json_response({"error": str(e)})
 
+# --- LIMITADOR DE PETICIONES Y REINTENTOS ---
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+
+class RateBucket:
+    """Per-minute token bucket (requests or tokens); a limit of 0 means unlimited.
+
+    Callers reserve what they are about to use and sleep off any debt; adjust() settles the
+    difference once the real usage is known.
+    """
+    def __init__(self, per_minute=0):
+        self._lock = threading.Lock()
+        self.limit = 0
+        self.tokens = 0.0
+        self._stamp = time.monotonic()
+        self.set_limit(per_minute)
+
+    def set_limit(self, per_minute):
+        per_minute = max(0, int(per_minute))
+        with self._lock:
+            if per_minute == self.limit: return
+            self.limit = per_minute
+            self.tokens = float(per_minute)
+            self._stamp = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.limit, self.tokens + (now - self._stamp) * self.limit / 60.0)
+        self._stamp = now
+
+    def reserve(self, n):
+        """Takes n and returns the seconds to wait before using them."""
+        with self._lock:
+            if self.limit <= 0: return 0.0
+            self._refill()
+            self.tokens -= n
+            return -self.tokens * 60.0 / self.limit if self.tokens < 0 else 0.0
+
+    def adjust(self, n):
+        with self._lock:
+            if self.limit > 0:
+                self._refill()
+                self.tokens -= n
+
+def retry_after_seconds(error):
+    """Server-requested delay from a Retry-After header or a Gemini RetryInfo ("retryDelay": "12s"), if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if value:
+            try: return max(0.0, float(value))
+            except ValueError: pass
+    match = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", str(getattr(error, "details", "")) + str(error))
+    return float(match.group(1)) if match else None
+
+def is_retryable(error):
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int): return code in RETRYABLE_STATUS
+    return isinstance(error, TRANSIENT_ERRORS)
+
+class GeminiGovernor:
+    """Shared RPM/TPM limiter and retry policy for every Gemini call of the node (and its batches).
+
+    Input tokens are estimated before the call and corrected from usage_metadata afterwards.
+    429 / 5xx / network errors are retried with exponential backoff and jitter (or the server's
+    Retry-After), within max_retries and max_retry_wait.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.buckets = {}  # modelo -> (RateBucket rpm, RateBucket tpm)
+        self.calls = self.throttled = self.retried = self.rate_limited = self.failed = 0
+        self.throttle_seconds = self.backoff_seconds = 0.0
+
+    def _buckets(self, model):
+        limits = GEMINI_SETTINGS["rate_limits"]
+        cfg = limits.get(model) or limits.get("default") or {}
+        with self._lock:
+            pair = self.buckets.get(model)
+            if pair is None:
+                pair = self.buckets[model] = (RateBucket(), RateBucket())
+        pair[0].set_limit(cfg.get("rpm", 0))
+        pair[1].set_limit(cfg.get("tpm", 0))
+        return pair
+
+    def _count(self, **deltas):
+        with self._lock:
+            for k, v in deltas.items(): setattr(self, k, getattr(self, k) + v)
+
+    def call(self, model, estimated_tokens, fn):
+        rpm, tpm = self._buckets(model)
+        attempt, waited = 0, 0.0
+        while True:
+            wait = max(rpm.reserve(1), tpm.reserve(estimated_tokens))
+            if wait > 0:
+                self._count(throttled=1, throttle_seconds=wait)
+                time.sleep(wait)
+            self._count(calls=1)
+            try:
+                response = fn()
+            except Exception as e:
+                tpm.adjust(-estimated_tokens)
+                code = getattr(e, "code", None) or getattr(e, "status_code", None)
+                if code == 429: self._count(rate_limited=1)
+                if not is_retryable(e) or attempt >= GEMINI_SETTINGS["max_retries"]:
+                    if is_retryable(e): self._count(failed=1)
+                    raise
+                attempt += 1
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    step = min(GEMINI_SETTINGS["backoff_max"], GEMINI_SETTINGS["backoff_base"] * 2 ** (attempt - 1))
+                    delay = step / 2 + random.uniform(0, step / 2)
+                else:
+                    delay += random.uniform(0, 1.0)
+                if waited + delay > GEMINI_SETTINGS["max_retry_wait"]:
+                    self._count(failed=1)
+                    raise
+                waited += delay
+                self._count(retried=1, backoff_seconds=delay)
+                print(f"[AcademiaSD] ⏳ {model}: {e} - retry {attempt}/{GEMINI_SETTINGS['max_retries']} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            usage = getattr(response, "usage_metadata", None)
+            used = getattr(usage, "prompt_token_count", None) or getattr(usage, "total_token_count", None)
+            if used: tpm.adjust(used - estimated_tokens)
+            return response
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "throttled": self.throttled, "throttle_seconds": round(self.throttle_seconds, 1),
+                    "retried": self.retried, "rate_limited": self.rate_limited, "failed_after_retries": self.failed,
+                    "backoff_seconds": round(self.backoff_seconds, 1)}
+
+GEMINI_GOVERNOR = GeminiGovernor()
+
+def estimate_tokens(pixels, final_text, config_args):
+    # ~4 caracteres por token y ~258 tokens por imagen; el valor real se corrige con usage_metadata
+    text = final_text + str(config_args.get("system_instruction", ""))
+    return max(1, len(text) // 4 + 258 * len(pixels))
+
+@PromptServer.instance.routes.get("/academia/gemini_stats")
+async def get_gemini_stats(request):
+    return web.json_response({"clients": GEMINI_CLIENTS.stats(), "cache": GEMINI_CACHE.stats(), "governor": GEMINI_GOVERNOR.stats()})
+
+@PromptServer.instance.routes.post("/academia/gemini_cache/clear")
+async def clear_gemini_cache(request):
+    removed = await asyncio.to_thread(GEMINI_CACHE.clear)
+    return web.json_response({"status": "success", "removed": removed})
+
+@PromptServer.instance.routes.get("/academia/gemini_settings")
+async def get_gemini_settings(request):
+    return web.json_response(GEMINI_SETTINGS)
+
+@PromptServer.instance.routes.post("/academia/gemini_settings")
+async def save_gemini_settings(request):
+    data = await request.json()
+    try:
+        for k in GEMINI_SETTINGS:
+            if k in data: GEMINI_SETTINGS[k] = type(GEMINI_SETTINGS[k])(data[k])
+        with GEMINI_CACHE._lock:
+            GEMINI_CACHE._evict(max(0, GEMINI_SETTINGS["cache_mb"]) * 1024 * 1024)
+        with open(GEMINI_SETTINGS_FILE, "w") as f:
+            json.dump(GEMINI_SETTINGS, f, indent=4)
+        return web.json_response({"status": "success", "settings": GEMINI_SETTINGS})
+    except Exception as e: return web.json_response({"status": "error", "message": str(e)})
 
 class AcademiaGeminiVision:
     def __init__(self):
@@ -114,92 +471,135 @@ class AcademiaGeminiVision:
                 "sys_prompt": ("STRING", {"multiline": True, "default": ""}),
                 "temperature": ("FLOAT", {"default": 0.7, "min": 0.0, "max": 2.0, "step": 0.1}),
                 "max_tokens": ("INT", {"default": 4096, "min": 1, "max": 131072, "step": 128}),
+                # Reutiliza la respuesta guardada si la petición es idéntica (imagen, texto, modelo y configuración)
+                "use_cache": ("BOOLEAN", {"default": False}),
+                # Lote: cada imagen del IMAGE se envía como petición propia, hasta max_concurrency a la vez
+                "batch_mode": ("BOOLEAN", {"default": False}),
+                "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 32}),
+                # Raise: un fallo (tras agotar los reintentos) detiene el prompt en vez de escribir "Error: ..." en el texto
+                "on_error": (["Raise", "Return error text"], {"default": "Raise"}),
             }
         }
 
-    RETURN_TYPES = ("STRING",)
-    RETURN_NAMES = ("text",)
+    RETURN_TYPES = ("STRING", "STRING", "STRING")
+    RETURN_NAMES = ("text", "texts", "errors")
+    # texts / errors: una entrada por imagen del lote, en orden ("" donde no hubo error / no hubo texto);
+    # los errores por imagen solo se devuelven en modo lote, fuera de él se aplica on_error
+    OUTPUT_IS_LIST = (False, True, True)
     FUNCTION = "analyze"
     CATEGORY = "Academia SD"
 
-    def analyze(self, instruction, api_key, model, image=None, external_prompt=None, width=None, height=None, sys_prompt="", temperature=0.7, max_tokens=4096):
-        if not HAS_GENAI:
-            error_msg = "Error: 'google-genai' library is not installed. Please run: pip install google-genai"
+    def generate(self, api_key, model, pixels, final_text, config_args, use_cache, verbose=True):
+        """One request to Gemini (or the response cache). Returns the text; raises on API errors."""
+        contents = [Image.fromarray(arr) for arr in pixels]
+        if final_text.strip():
+            contents.append(final_text)
+
+        cache_key = None
+        if use_cache and GEMINI_SETTINGS["cache_mb"] > 0:
+            cache_key = GEMINI_CACHE.make_key(pixels, final_text, model, config_args)
+            cached = GEMINI_CACHE.get(cache_key)
+            if cached is not None:
+                if verbose: print(f"[AcademiaSD] ♻️ {model}: identical request, using the cached response")
+                return cached
+
+        config = types.GenerateContentConfig(**config_args)
+
+        # Enviar a Gemini con la nueva configuración
+        if verbose: print(f"[AcademiaSD] 👁️✨ Sending request to {model}...")
+        client = GEMINI_CLIENTS.get(api_key)
+        response = GEMINI_GOVERNOR.call(model, estimate_tokens(pixels, final_text, config_args), lambda: client.models.generate_content(
+            model=model,
+            contents=contents,
+            config=config
+        ))
+
+        if cache_key is not None and response.text is not None:
+            GEMINI_CACHE.put(cache_key, response.text, model)
+        return response.text
+
+    def analyze(self, instruction, api_key, model, image=None, external_prompt=None, width=None, height=None, sys_prompt="", temperature=0.7, max_tokens=4096, use_cache=False,
+                batch_mode=False, max_concurrency=4, on_error="Raise"):
+        def fail(error_msg):
             print(f"[AcademiaSD] ❌ {error_msg}")
-            return (error_msg,)
+            if on_error == "Raise": raise RuntimeError(f"[AcademiaSD] Gemini Vision: {error_msg}")
+            return (error_msg, [""], [error_msg])
+
+        if not HAS_GENAI:
+            return fail("Error: 'google-genai' library is not installed. Please run: pip install google-genai")
         
         # --- LECTURA SEGURA DE LA API KEY ---
         if not api_key or api_key.strip() == "" or api_key.strip() == "****":
-            try:
-                if os.path.exists(TOKENS_FILE):
-                    with open(TOKENS_FILE, "r") as f:
-                        tdata = json.load(f)
-                        api_key = tdata.get("gemini", "")
-            except:
-                pass
+            api_key = load_saved_gemini_key()
 
         if not api_key or api_key.strip() == "" or api_key.strip() == "****":
-            error_msg = "Error: API Key is missing. Please provide a valid Google Gemini API Key."
-            print(f"[AcademiaSD] ❌ {error_msg}")
-            return (error_msg,)
+            return fail("Error: API Key is missing. Please provide a valid Google Gemini API Key.")
 
-        try:
-            print(f"[AcademiaSD] 👁️✨ Sending request to {model}...")
-            client = genai.Client(api_key=api_key.strip(), http_options={'api_version': 'v1beta'})
-            
-            contents = []
-            
-            # 1. Procesar Imagen (Si se conectó)
-            if image is not None:
-                i = 255. * image.cpu().numpy()
-                img = Image.fromarray(np.clip(i[0], 0, 255).astype(np.uint8))
-                contents.append(img)
-            
-            # 2. Procesar Textos
-            final_text = instruction
-            
-            # 3. INYECTAR LA RESOLUCIÓN AL PROMPT SI ESTÁN CONECTADAS
-            if width is not None and height is not None:
-                final_text += f"\n\n[RESOLUTION INFO]\nThe target image resolution is {width}px (Width) by {height}px (Height). If you generate bounding boxes (bbox), you MUST map the coordinates strictly to these dimensions."
-            elif width is not None:
-                final_text += f"\n\n[RESOLUTION INFO]\nThe target image width is {width}px. Please map your coordinates accordingly."
-            elif height is not None:
-                final_text += f"\n\n[RESOLUTION INFO]\nThe target image height is {height}px. Please map your coordinates accordingly."
-
-            # 4. Inyectar Prompt Externo si existe
-            if external_prompt and str(external_prompt).strip() != "":
-                final_text += f"\n\n--- EXTERNAL PROMPT / DATA ---\n{external_prompt}"
-            
-            if final_text.strip():
-                contents.append(final_text)
+        # 1. Procesar Imagen (Si se conectó); en modo lote, cada imagen es una petición
+        frames = []
+        if image is not None:
+            i = 255. * image.cpu().numpy()
+            frames = [np.clip(frame, 0, 255).astype(np.uint8) for frame in (i if batch_mode else i[:1])]
+        
+        # 2. Procesar Textos
+        final_text = instruction
+        
+        # 3. INYECTAR LA RESOLUCIÓN AL PROMPT SI ESTÁN CONECTADAS
+        if width is not None and height is not None:
+            final_text += f"\n\n[RESOLUTION INFO]\nThe target image resolution is {width}px (Width) by {height}px (Height). If you generate bounding boxes (bbox), you MUST map the coordinates strictly to these dimensions."
+        elif width is not None:
+            final_text += f"\n\n[RESOLUTION INFO]\nThe target image width is {width}px. Please map your coordinates accordingly."
+        elif height is not None:
+            final_text += f"\n\n[RESOLUTION INFO]\nThe target image height is {height}px. Please map your coordinates accordingly."
 
-            if not contents:
-                return ("Error: Provide at least an image or a text instruction.",)
+        # 4. Inyectar Prompt Externo si existe
+        if external_prompt and str(external_prompt).strip() != "":
+            final_text += f"\n\n--- EXTERNAL PROMPT / DATA ---\n{external_prompt}"
 
-            # 5. Configurar los nuevos parámetros (Temperature, Max Tokens, System Prompt)
-            config_args = {
-                "temperature": temperature,
-                "max_output_tokens": max_tokens,
-            }
-            # Evitamos enviar sys_prompt vacío si el usuario no escribió nada
-            if sys_prompt and str(sys_prompt).strip() != "":
-                config_args["system_instruction"] = str(sys_prompt).strip()
-            
-            config = types.GenerateContentConfig(**config_args)
-
-            # Enviar a Gemini con la nueva configuración
-            response = client.models.generate_content(
-                model=model,
-                contents=contents,
-                config=config
-            )
-            
+        if not frames and not final_text.strip():
+            return fail("Error: Provide at least an image or a text instruction.")
+
+        # 5. Configurar los nuevos parámetros (Temperature, Max Tokens, System Prompt)
+        config_args = {
+            "temperature": temperature,
+            "max_output_tokens": max_tokens,
+        }
+        # Evitamos enviar sys_prompt vacío si el usuario no escribió nada
+        if sys_prompt and str(sys_prompt).strip() != "":
+            config_args["system_instruction"] = str(sys_prompt).strip()
+
+        requests = [[frame] for frame in frames] or [[]]
+        if len(requests) == 1:
+            try:
+                text = self.generate(api_key, model, requests[0], final_text, config_args, use_cache)
+            except Exception as e:
+                return fail(f"Error: {str(e)}")
             print(f"[AcademiaSD] ✅ {model} successfully generated the content!")
-            return (response.text,)
+            return (text, [text], [""])
 
-        except Exception as e:
-            print(f"[AcademiaSD] ❌ Gemini API Error: {e}")
-            return (f"Error: {str(e)}",)
+        # --- MODO LOTE: una petición por imagen, con concurrencia limitada ---
+        def run(pixels):
+            try:
+                return self.generate(api_key, model, pixels, final_text, config_args, use_cache, verbose=False), ""
+            except Exception as e:
+                return "", f"Error: {str(e)}"
+
+        workers = max(1, min(int(max_concurrency), len(requests)))
+        print(f"[AcademiaSD] 👁️✨ Sending {len(requests)} images to {model} ({workers} at a time)...")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="academia_gemini") as pool:
+            results = list(pool.map(run, requests))
+        texts = [text for text, _ in results]
+        errors = [error for _, error in results]
+        failed = sum(1 for error in errors if error)
+        if failed:
+            print(f"[AcademiaSD] ⚠️ {model}: {len(results) - failed}/{len(results)} images processed, {failed} failed")
+            for n, error in enumerate(errors):
+                if error: print(f"[AcademiaSD]    #{n}: {error}")
+        else:
+            print(f"[AcademiaSD] ✅ {model} successfully processed {len(results)} images!")
+        if failed == len(results) and on_error == "Raise":
+            raise RuntimeError(f"[AcademiaSD] Gemini Vision: every image in the batch failed ({errors[0]})")
+        return (texts[0], texts, errors)
 
 NODE_CLASS_MAPPINGS = {
     "AcademiaSD_GeminiVision": AcademiaGeminiVision